@@ -0,0 +1,79 @@
+"""
+Micro-benchmark: legacy RAG retrieval vs the shared top-k kernel in server.py.
+
+Legacy path (what the routes used to do per request):
+    lists -> sklearn cosine_similarity (re-normalizes the corpus) -> full argsort -> top_k
+Kernel path:
+    pre-normalized contiguous float32 matrix -> one matrix product per block -> argpartition
+
+Usage:
+    python bench_retrieval.py                      # 1k / 100k / 1M rows, 384D
+    python bench_retrieval.py --rows 100000 --dim 1024 --queries 8
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from server import normalize_rows, top_k_cosine
+
+# Building Python lists for 1M x 384 floats needs several GB; only time that step below this size
+MAX_LIST_ROWS = 100_000
+
+
+def best_of(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def legacy_search(query, corpus, k):
+    sims = cosine_similarity([query], corpus)[0]
+    return sims.argsort()[-k:][::-1]
+
+
+def run(rows: int, dim: int, k: int, n_queries: int, repeats: int, chunk_rows: int):
+    rng = np.random.default_rng(0)
+    corpus = rng.standard_normal((rows, dim), dtype=np.float32)
+    queries = rng.standard_normal((n_queries, dim), dtype=np.float32)
+    normalized = normalize_rows(corpus)
+
+    results = {}
+    results["legacy (array)"] = best_of(lambda: [legacy_search(q, corpus, k) for q in queries], repeats)
+    if rows <= MAX_LIST_ROWS:
+        corpus_list = corpus.tolist()
+        results["legacy (lists)"] = best_of(lambda: [legacy_search(q.tolist(), corpus_list, k) for q in queries], repeats)
+    results["kernel (per query)"] = best_of(lambda: [top_k_cosine(normalized, q, k) for q in queries], repeats)
+    results["kernel (batched)"] = best_of(lambda: top_k_cosine(normalized, queries, k), repeats)
+    results["kernel (chunked)"] = best_of(lambda: top_k_cosine(normalized, queries, k, chunk_rows=chunk_rows), repeats)
+
+    # Same answers as the legacy path
+    expected = legacy_search(queries[0], corpus, k)
+    got, _ = top_k_cosine(normalized, queries[0], k)
+    assert set(expected.tolist()) == set(got.tolist()), "kernel disagrees with legacy top-k"
+
+    baseline = results["legacy (array)"]
+    print(f"\n{rows:,} rows x {dim}D, top_k={k}, {n_queries} queries (best of {repeats})")
+    for name, seconds in results.items():
+        print(f"  {name:<20} {seconds * 1000:10.2f} ms   {baseline / seconds:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--chunk-rows", type=int, default=65_536)
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.dim, args.top_k, args.queries, args.repeats, args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Accuracy check: compare a candidate embedding backend (int8 / onnx) against fp32 on a sample set.
+
+Reports, per model:
+  - cosine(fp32, candidate) for each text (mean / p5 / min) - how far vectors moved
+  - top-k neighbour overlap within the sample - whether retrieval results change
+  - encode throughput of both backends on the same threads
+
+Usage:
+    python check_embedding_drift.py --backend int8
+    python check_embedding_drift.py --model large --backend onnx --texts corpus.txt --limit 2000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from server import (
+    EMBEDDING_THREADS,
+    LARGE_EMBEDDING_MODEL,
+    SMALL_EMBEDDING_MODEL,
+    load_sentence_transformer,
+    normalize_rows,
+    set_torch_threads,
+    top_k_cosine,
+)
+
+MODELS = {"small": SMALL_EMBEDDING_MODEL, "large": LARGE_EMBEDDING_MODEL}
+
+SAMPLE_TEXTS = [
+    "The quarterly report shows revenue growth of 12 percent driven by cloud services.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "The defendant appealed the ruling to the circuit court on procedural grounds.",
+    "Preheat the oven to 180 degrees and bake the bread for forty minutes.",
+    "A transformer encoder maps token sequences to contextual embeddings.",
+    "The patient presented with fever, cough and shortness of breath for three days.",
+    "Interest rates were left unchanged as inflation eased toward the target.",
+    "The bridge was closed for repairs after inspectors found corroded cables.",
+    "Mitochondria are the site of oxidative phosphorylation in eukaryotic cells.",
+    "The striker scored twice in the second half to secure the championship.",
+    "Knowledge graphs represent entities as nodes and relations as labelled edges.",
+    "Heavy rain is expected across the northern region through the weekend.",
+]
+
+
+def load_texts(path, limit):
+    if not path:
+        texts = SAMPLE_TEXTS
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    return texts[:limit] if limit else texts
+
+
+def timed_encode(model, texts, batch_size):
+    started = time.perf_counter()
+    embs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return np.asarray(embs, dtype=np.float32), time.perf_counter() - started
+
+
+def neighbour_overlap(reference, candidate, k):
+    """Mean fraction of each text's fp32 top-k neighbours that the candidate also returns."""
+    k = min(k, len(reference))
+    ref_ids, _ = top_k_cosine(reference, reference, k)
+    cand_ids, _ = top_k_cosine(candidate, candidate, k)
+    return float(np.mean([len(set(r.tolist()) & set(c.tolist())) / k for r, c in zip(ref_ids, cand_ids)]))
+
+
+def run(model_key, backend, texts, batch_size, k):
+    model_name = MODELS[model_key]
+    set_torch_threads(EMBEDDING_THREADS)
+    reference_model = load_sentence_transformer(model_name, "fp32")
+    candidate_model = load_sentence_transformer(model_name, backend)
+
+    # First call pays one-off graph/allocator setup; keep it out of the timing
+    timed_encode(reference_model, texts[:batch_size], batch_size)
+    timed_encode(candidate_model, texts[:batch_size], batch_size)
+    reference, ref_s = timed_encode(reference_model, texts, batch_size)
+    candidate, cand_s = timed_encode(candidate_model, texts, batch_size)
+
+    reference, candidate = normalize_rows(reference), normalize_rows(candidate)
+    cosines = np.sum(reference * candidate, axis=1)
+
+    print(f"\n{model_name}: fp32 vs {backend} on {len(texts)} texts ({EMBEDDING_THREADS} threads)")
+    print(f"  cosine drift   mean={cosines.mean():.5f}  p5={np.percentile(cosines, 5):.5f}  min={cosines.min():.5f}")
+    print(f"  top-{min(k, len(texts))} overlap  {neighbour_overlap(reference, candidate, k):.4f}")
+    print(f"  throughput     fp32={len(texts) / ref_s:8.1f}/s  {backend}={len(texts) / cand_s:8.1f}/s  "
+          f"speedup={ref_s / cand_s:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=sorted(MODELS), nargs="+", default=["small", "large"])
+    parser.add_argument("--backend", choices=["int8", "onnx"], default="int8")
+    parser.add_argument("--texts", help="file with one sample text per line (default: built-in sample)")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+    texts = load_texts(args.texts, args.limit)
+    for model_key in args.model:
+        run(model_key, args.backend, texts, args.batch_size, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,34 @@ import json
 import tempfile
 import subprocess
 import re
-from typing import List, Optional, Dict, Any, Tuple
+import queue
+import shutil
+import struct
+import sqlite3
+import hashlib
+import unicodedata
+import asyncio
+import functools
+import multiprocessing
+import threading
+import contextlib
+import fcntl
+import socket
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict, defaultdict
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable
 from fastapi import FastAPI, File, Form, UploadFile, HTTPException
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from PIL import Image
+from PIL import Image, ImageOps
 import time
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
 # External deps
 import uuid
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 
 # S3-compatible (Akave O3)
 import boto3
@@ -44,61 +60,657 @@ EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "16"))
 os.environ.setdefault("OMP_NUM_THREADS", str(MISTRAL_THREADS))
 os.environ.setdefault("MKL_NUM_THREADS", str(MISTRAL_THREADS))
 
+# Local state (caches, job store, saved llama.cpp prompt state)
+OMNIMIND_STATE_DIR = os.environ.get("OMNIMIND_STATE_DIR", "./.omnimind")
+
 LLAMA_CPP_BIN = os.environ.get("LLAMA_CPP_BIN", "./llama_cpp/build/bin/llama-cli")
 MISTRAL_GGUF = os.environ.get("MISTRAL_GGUF", "./models/mistral-7b-instruct-v0.2.Q4_K_M.gguf")
 
+# Resident llama.cpp pool: LLAMA_POOL_WORKERS llama-server processes, each with LLAMA_POOL_SLOTS parallel slots
+LLAMA_SERVER_BIN = os.environ.get("LLAMA_SERVER_BIN", "./llama_cpp/build/bin/llama-server")
+LLAMA_POOL_ENABLED = os.environ.get("LLAMA_POOL_ENABLED", "1") == "1"
+LLAMA_POOL_WORKERS = int(os.environ.get("LLAMA_POOL_WORKERS", "2"))
+LLAMA_POOL_SLOTS = int(os.environ.get("LLAMA_POOL_SLOTS", "2"))
+LLAMA_POOL_SLOT_CTX = int(os.environ.get("LLAMA_POOL_SLOT_CTX", "4096"))
+LLAMA_POOL_BASE_PORT = int(os.environ.get("LLAMA_POOL_BASE_PORT", "8081"))
+LLAMA_POOL_HEALTH_INTERVAL = float(os.environ.get("LLAMA_POOL_HEALTH_INTERVAL", "5"))
+# Per-port lock files: one pool per host, shared by all server processes using this state dir
+LLAMA_POOL_LOCK_DIR = os.path.join(OMNIMIND_STATE_DIR, "llama_pool")
+
+# Prompt-prefix KV reuse for registered fixed prompts: llama-server slot save/restore + slot affinity,
+# llama-cli --prompt-cache files
+LLAMA_PREFIX_CACHE_ENABLED = os.environ.get("LLAMA_PREFIX_CACHE_ENABLED", "1") == "1"
+LLAMA_SLOT_SAVE_PATH = os.environ.get("LLAMA_SLOT_SAVE_PATH", os.path.join(OMNIMIND_STATE_DIR, "llama_slots"))
+LLAMA_PROMPT_CACHE_DIR = os.environ.get("LLAMA_PROMPT_CACHE_DIR", os.path.join(OMNIMIND_STATE_DIR, "llama_prompt_cache"))
+LLAMA_POOL_ACQUIRE_TIMEOUT = float(os.environ.get("LLAMA_POOL_ACQUIRE_TIMEOUT", "60"))
+
 PIXTRAL_HTTP_URL = os.environ.get("PIXTRAL_HTTP_URL")
 OLLAMA_HTTP_URL = os.environ.get("OLLAMA_HTTP_URL")
 OLLAMA_MODEL_PIXTRAL = os.environ.get("OLLAMA_MODEL_PIXTRAL", "pixtral")
 OLLAMA_MODEL_MISTRAL = os.environ.get("OLLAMA_MODEL_MISTRAL", "mistral")
 
-_small_embedder = None
-_large_embedder = None
-_blip_processor = None
-_blip_model = None
+SMALL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LARGE_EMBEDDING_MODEL = "intfloat/e5-large-v2"
+
+# Execution lanes: blocking work never runs on the event loop
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "2"))
+LLM_WORKERS = int(os.environ.get("LLM_WORKERS", str(max(1, LLAMA_POOL_WORKERS * LLAMA_POOL_SLOTS))))
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "16"))
+
+# RAG context cache: normalized float32 matrices keyed by content hash
+RAG_CACHE_TTL = float(os.environ.get("RAG_CACHE_TTL", "300"))
+RAG_CACHE_MAX_BYTES = int(os.environ.get("RAG_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Query embedding cache: LRU of query vectors per embedding model
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+
+# Semantic answer cache: generated RAG answers reused for the same corpus + retrieved contexts
+# when the new query embedding is at least ANSWER_CACHE_SIMILARITY cosine-close to a cached one
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "900"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+# Dynamic micro-batching for sentence-transformer encode calls
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", "64"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", "5"))
+BLIP_BATCH_MAX_SIZE = int(os.environ.get("BLIP_BATCH_MAX_SIZE", "8"))
+BLIP_BATCH_MAX_WAIT_MS = float(os.environ.get("BLIP_BATCH_MAX_WAIT_MS", "10"))
+
+# Image preprocessing: uploads over these caps are rejected (413) before any model or HTTP call
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(50_000_000)))
+BLIP_IMAGE_SIZE = int(os.environ.get("BLIP_IMAGE_SIZE", "384"))
+PIXTRAL_IMAGE_MAX_SIDE = int(os.environ.get("PIXTRAL_IMAGE_MAX_SIDE", "1024"))
+PIXTRAL_JPEG_QUALITY = int(os.environ.get("PIXTRAL_JPEG_QUALITY", "90"))
+
+# Embedding inference backend per model: fp32 (torch), int8 (dynamically quantized torch), onnx (ONNX Runtime)
+EMBEDDING_BACKENDS = ("fp32", "int8", "onnx")
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "fp32")
+EMBEDDING_BACKEND_SMALL = os.environ.get("EMBEDDING_BACKEND_SMALL", EMBEDDING_BACKEND)
+EMBEDDING_BACKEND_LARGE = os.environ.get("EMBEDDING_BACKEND_LARGE", EMBEDDING_BACKEND)
+for _name, _backend in (("EMBEDDING_BACKEND_SMALL", EMBEDDING_BACKEND_SMALL), ("EMBEDDING_BACKEND_LARGE", EMBEDDING_BACKEND_LARGE)):
+    # Fail at startup rather than on the first encode (or in /health)
+    if _backend not in EMBEDDING_BACKENDS:
+        raise RuntimeError(f"Unknown embedding backend {_backend!r} in {_name}/EMBEDDING_BACKEND; expected one of {EMBEDDING_BACKENDS}")
+# Optional ONNX file inside the model repo, e.g. onnx/model_qint8_avx512_vnni.onnx
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE")
+
+# ANN (IVF) index: built at ingestion and used by /rag/by_id for corpora with >= ANN_MIN_ROWS rows
+ANN_MIN_ROWS = int(os.environ.get("ANN_MIN_ROWS", "20000"))
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))
+ANN_KMEANS_ITERS = int(os.environ.get("ANN_KMEANS_ITERS", "10"))
+ANN_TRAIN_SAMPLE = int(os.environ.get("ANN_TRAIN_SAMPLE", "65536"))
+
+# PDF ingestion: page extraction process pool and token-window chunking
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "4"))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "8"))
+PDF_MAX_INFLIGHT_TASKS = int(os.environ.get("PDF_MAX_INFLIGHT_TASKS", str(2 * PDF_WORKERS)))
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+
+# KG extraction: per-window prompt size (default leaves room for the reply in one pool slot)
+KG_MAX_TOKENS = int(os.environ.get("KG_MAX_TOKENS", "800"))
+KG_WINDOW_CHARS = int(os.environ.get("KG_WINDOW_CHARS", str(max(1024, (LLAMA_POOL_SLOT_CTX - KG_MAX_TOKENS - 512) * 3))))
+KG_MAX_WINDOWS = int(os.environ.get("KG_MAX_WINDOWS", "128"))
+# Windows in flight on llm_lane across all KG builds; the default keeps one lane thread free so
+# interactive RAG/SSE generations never queue behind a large KG backlog
+KG_MAX_CONCURRENT_WINDOWS = int(os.environ.get("KG_MAX_CONCURRENT_WINDOWS", str(max(1, LLM_WORKERS - 1))))
+
+# Exact retrieval scores corpora in blocks of this many rows to bound peak memory
+RETRIEVAL_CHUNK_ROWS = int(os.environ.get("RETRIEVAL_CHUNK_ROWS", "262144"))
+
+# Models loaded (and warmed up) in the background at startup: comma list of small, large, blip
+MODEL_PRELOAD = [m.strip() for m in os.environ.get("MODEL_PRELOAD", "small").split(",") if m.strip()]
+
+# --------------------- Execution layer ---------------------
+class ExecutionLane:
+    """A bounded thread pool for one class of blocking work (CPU inference, LLM calls, network I/O)."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-lane")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            result = fn(*args, **kwargs)
+            with self._lock:
+                self.completed += 1
+            return result
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self._call, fn, args, kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        # Queued = submitted but waiting for a free thread
+        queued = self.executor._work_queue.qsize()
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queued": queued,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+cpu_lane = ExecutionLane("cpu", INFERENCE_WORKERS)
+llm_lane = ExecutionLane("llm", LLM_WORKERS)
+io_lane = ExecutionLane("io", IO_WORKERS)
+
+class MicroBatcher:
+    """
+    Collects pending submissions for up to `max_wait_ms` (or until `max_batch` items are
+    queued), runs `process_fn` once over the combined items on a dedicated thread and
+    scatters the per-item results back to each caller's Future.
+    Submissions only share a batch when their keyword options are identical. A submission
+    larger than `max_batch` is fed to the queue one `max_batch` slice at a time (the next slice
+    is queued when the previous one finishes), so other callers wait for at most one slice.
+    """
+
+    def __init__(self, name: str, process_fn, max_batch: int, max_wait_ms: float):
+        self.name = name
+        self.process_fn = process_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[List[Any], Dict[str, Any], Future]]" = queue.Queue()
+        self._carry: Optional[Tuple[List[Any], Dict[str, Any], Future]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.histogram: Dict[int, int] = {}
+
+    def submit(self, items: List[Any], **options) -> Future:
+        fut: Future = Future()
+        if not items:
+            fut.set_result([])
+            return fut
+        self._ensure_started()
+        items = list(items)
+        if len(items) <= self.max_batch:
+            self._queue.put((items, options, fut))
+        else:
+            self._submit_slices(items, options, fut, [])
+        return fut
+
+    def _submit_slices(self, items: List[Any], options: Dict[str, Any], fut: Future, results: List[Any]):
+        """Queue the next slice of an oversized submission; resolves `fut` once every slice is done."""
+        if fut.done():  # cancelled by the caller: drop the remaining slices
+            return
+        start = len(results)
+        part: Future = Future()
+
+        def on_done(done: Future):
+            try:
+                if done.cancelled() or fut.done():
+                    return
+                if done.exception() is not None:
+                    fut.set_exception(done.exception())
+                    return
+                results.extend(done.result())
+                if len(results) >= len(items):
+                    fut.set_result(results)
+                else:
+                    self._submit_slices(items, options, fut, results)
+            except InvalidStateError:
+                pass  # cancelled concurrently
+
+        part.add_done_callback(on_done)
+        self._queue.put((items[start:start + self.max_batch], options, part))
+
+    async def run(self, items: List[Any], **options):
+        return await asyncio.wrap_future(self.submit(items, **options))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _next(self, timeout: Optional[float]):
+        if self._carry is not None:
+            entry, self._carry = self._carry, None
+            return entry
+        return self._queue.get(timeout=timeout)
+
+    def _loop(self):
+        while True:
+            first = self._next(None)
+            batch = [first]
+            count = len(first[0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._next(remaining)
+                except queue.Empty:
+                    break
+                if entry[1] != first[1] or count + len(entry[0]) > self.max_batch:
+                    self._carry = entry
+                    break
+                batch.append(entry)
+                count += len(entry[0])
+            try:
+                self._run_batch(batch, first[1])
+            except Exception as e:
+                # A bad batch must never end the loop: later submissions would wait forever
+                print(f"Batcher {self.name} failed to deliver a batch: {e}")
+
+    def _run_batch(self, batch, options: Dict[str, Any]):
+        # Callers that were cancelled while queued (e.g. client disconnects) are dropped here;
+        # the rest can no longer be cancelled, so setting their results below cannot fail
+        batch = [entry for entry in batch if entry[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        items = [item for entry in batch for item in entry[0]]
+        self.batches += 1
+        self.items += len(items)
+        bucket = 1 << max(0, len(items) - 1).bit_length()  # next power of two
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+        try:
+            results = self.process_fn(items, **options)
+        except Exception as e:
+            for _, _, fut in batch:
+                fut.set_exception(e)
+            return
+        pos = 0
+        for entry_items, _, fut in batch:
+            fut.set_result(results[pos:pos + len(entry_items)])
+            pos += len(entry_items)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            # key = batch-size bucket upper bound (1, 2, 4, 8, ...)
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.histogram.items())},
+        }
 
 # --------------------- RAG Cache System ---------------------
+def normalize_rows(matrix: Any) -> np.ndarray:
+    """Return a contiguous float32 copy of `matrix` with unit-length rows (zero rows left as zeros)."""
+    matrix = np.array(matrix, dtype=np.float32, order="C", ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
 class RAGCache:
-    def __init__(self):
-        self.cache = {}
-        self.expiry_time = 30  # seconds
-    
-    def get_key(self, embeddings: List[List[float]]):
-        """Generate a hash key from embeddings"""
-        if not embeddings:
+    """
+    Content-addressed cache of RAG contexts.
+    Keys are a SHA-256 over the full embedding matrix and texts; values hold the
+    row-normalized float32 matrix so hits skip conversion and normalization.
+    Entries expire after `ttl` seconds and are evicted LRU once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = RAG_CACHE_MAX_BYTES, ttl: float = RAG_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def get_key(matrix: np.ndarray, texts: List[str]) -> Optional[str]:
+        if matrix.size == 0:
             return None
-        # Use first few values and length as key (simplified hash)
-        key_parts = [len(embeddings)]
-        if embeddings and len(embeddings[0]) >= 5:
-            key_parts.extend([round(x, 4) for x in embeddings[0][:5]])
-        return tuple(key_parts)
-    
-    def get(self, key):
-        if key in self.cache:
-            entry = self.cache[key]
-            if time.time() - entry['timestamp'] < self.expiry_time:
-                return entry['context']
-        return None
-    
-    def set(self, key, context):
-        self.cache[key] = {
-            'context': context,
-            'timestamp': time.time()
+        h = hashlib.sha256()
+        h.update(f"{matrix.shape[0]}x{matrix.shape[1]}".encode("ascii"))
+        h.update(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+        for text in texts:
+            data = text.encode("utf-8")
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry["timestamp"] >= self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: str, normalized: np.ndarray, texts: List[str]) -> Dict[str, Any]:
+        nbytes = normalized.nbytes + sum(len(t) for t in texts)
+        entry = {"key": key, "matrix": normalized, "texts": texts, "timestamp": time.time(), "nbytes": nbytes}
+        if nbytes > self.max_bytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return entry
+
+    def get_or_build(self, embeddings: Any, texts: List[str]) -> Dict[str, Any]:
+        """Blocking (hash + normalize); call through cpu_lane from routes."""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        key = self.get_key(matrix, texts)
+        if key is not None:
+            entry = self.get(key)
+            if entry is not None:
+                return entry
+        normalized = normalize_rows(matrix)
+        if key is None:
+            return {"key": None, "matrix": normalized, "texts": texts, "timestamp": time.time(), "nbytes": normalized.nbytes}
+        return self.set(key, normalized, texts)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry["nbytes"]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
         }
-        # Clean up expired entries
-        self._cleanup()
-    
-    def _cleanup(self):
-        current_time = time.time()
-        expired_keys = [k for k, v in self.cache.items() 
-                       if current_time - v['timestamp'] >= self.expiry_time]
-        for key in expired_keys:
-            del self.cache[key]
 
 # Initialize RAG cache
 rag_cache = RAGCache()
 
+class QueryEmbeddingCache:
+    """Size-bounded LRU of query vectors keyed by (model name, normalized query text)."""
+
+    def __init__(self, max_entries: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", query).split())
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        key = (model_name, self.normalize(query))
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model_name: str, query: str, vec: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        vec = np.array(vec, dtype=np.float32)
+        vec.setflags(write=False)  # shared between requests
+        key = (model_name, self.normalize(query))
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+query_embedding_cache = QueryEmbeddingCache()
+
+class AnswerCache:
+    """
+    Semantic cache of generated RAG answers.
+    Entries are grouped by an exact key (corpus, retrieved context ids, models); within a group a
+    lookup returns the answer of the most similar earlier query if its cosine similarity is at least
+    `threshold`, so rephrasings that retrieve the same contexts skip the LLM call.
+    Entries expire after `ttl` seconds and are evicted LRU beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._groups: Dict[str, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(scope: str, context_ids: List[Any], query_model: str, llm_model: str) -> str:
+        data = json.dumps([scope, context_ids, query_model, llm_model], ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str, query_vec: np.ndarray) -> Optional[Tuple[str, float]]:
+        """(answer, similarity) of the closest cached query under `key`, or None."""
+        q = normalize_rows(query_vec)[0]
+        now = time.time()
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for entry_id in list(self._groups.get(key, ())):
+                entry = self._entries[entry_id]
+                if now - entry["timestamp"] >= self.ttl:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                sim = float(entry["query_vec"] @ q)
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["answer"], best_sim
+
+    def store(self, key: str, query_vec: np.ndarray, answer: str):
+        # Failed generations come back as text from llama-cli; never serve those again
+        if self.max_entries <= 0 or not answer or answer.startswith("Error:"):
+            return
+        entry = {"key": key, "query_vec": normalize_rows(query_vec)[0], "answer": answer, "timestamp": time.time()}
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._groups.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        group = self._groups[entry["key"]]
+        group.remove(entry_id)
+        if not group:
+            del self._groups[entry["key"]]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "similarity_threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+answer_cache = AnswerCache()
+
+# --------------------- Retrieval kernel ---------------------
+def select_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values along the last axis, best first (argpartition + small sort)."""
+    n = scores.shape[-1]
+    k = max(0, min(k, n))
+    if k == 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
+
+def top_k_cosine(matrix: Any, queries: Any, k: int, norms: Optional[np.ndarray] = None,
+                 chunk_rows: int = RETRIEVAL_CHUNK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact cosine top-k of `queries` (d,) or (q, d) against a float32 corpus `matrix` (n, d).
+    `matrix` is taken as row-normalized unless its row `norms` are given (e.g. memory-mapped
+    payloads). Scores are one matrix product per block of `chunk_rows` rows, so peak memory is
+    q x chunk_rows regardless of corpus size. Returns (ids, scores) shaped (q, k), or (k,) for 1-D input.
+    """
+    single = np.ndim(queries) == 1
+    q = normalize_rows(queries)
+    n = len(matrix)
+    k = max(0, min(k, n))
+    best_ids = np.empty((len(q), 0), dtype=np.int64)
+    best_scores = np.empty((len(q), 0), dtype=np.float32)
+    for start in range(0, n, max(1, chunk_rows)):
+        block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+        scores = q @ block.T
+        if norms is not None:
+            scores /= norms[start:start + len(block)]
+        local = select_top_k(scores, k)
+        cand_ids = np.concatenate([best_ids, local + start], axis=1)
+        cand_scores = np.concatenate([best_scores, np.take_along_axis(scores, local, axis=1)], axis=1)
+        keep = select_top_k(cand_scores, k)
+        best_ids = np.take_along_axis(cand_ids, keep, axis=1)
+        best_scores = np.take_along_axis(cand_scores, keep, axis=1)
+    if single:
+        return best_ids[0], best_scores[0]
+    return best_ids, best_scores
+
+# --------------------- ANN index (IVF, CPU-only) ---------------------
+def _assign_to_centroids(matrix: np.ndarray, centroids: np.ndarray, chunk_rows: int = 8192) -> np.ndarray:
+    """Nearest centroid per row by inner product; row scaling does not change the argmax."""
+    out = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), chunk_rows):
+        block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+class IVFIndex:
+    """
+    Inverted-file index over a row-major embedding matrix.
+    Spherical k-means picks `nlist` centroids; each row is stored in the list of its
+    nearest centroid. A query scores only the rows of its `nprobe` closest lists, so
+    recall/latency is tuned per request via `nprobe`. Row vectors stay in the corpus
+    matrix (memory-mapped when cached); the index only holds ids and centroids.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_ids: np.ndarray):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_ids = np.asarray(list_ids, dtype=np.int64)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix: Any, nlist: Optional[int] = None, iters: int = ANN_KMEANS_ITERS, seed: int = 0) -> "IVFIndex":
+        n = len(matrix)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n, 65536))
+        rng = np.random.default_rng(seed)
+        sample_ids = np.sort(rng.choice(n, size=min(n, max(ANN_TRAIN_SAMPLE, nlist)), replace=False))
+        sample = normalize_rows(np.asarray(matrix[sample_ids], dtype=np.float32))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = _assign_to_centroids(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            nonempty = np.nonzero(counts)[0]
+            starts = (np.cumsum(counts) - counts)[nonempty]
+            sums = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts, axis=0)
+            centroids[nonempty] = sums
+            empty = np.nonzero(counts == 0)[0]
+            if len(empty):
+                centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+            centroids = normalize_rows(centroids)
+        assign = _assign_to_centroids(matrix, centroids)
+        list_ids = np.argsort(assign, kind="stable")
+        list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=nlist))))
+        return cls(centroids, list_offsets, list_ids)
+
+    def search(self, matrix: Any, norms: np.ndarray, query: np.ndarray, k: int, nprobe: int = ANN_NPROBE) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (row ids, cosine scores) for a unit-length `query`; `norms` are the corpus row norms."""
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe])
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates.sort()  # sequential reads from the memory-mapped matrix
+        scores = (np.asarray(matrix[candidates], dtype=np.float32) @ query) / norms[candidates]
+        top = select_top_k(scores, k)
+        return candidates[top], scores[top]
+
 # --------------------- Utilities ---------------------
+def row_norms(matrix: Any, chunk_rows: int = 65536) -> np.ndarray:
+    norms = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), chunk_rows):
+        norms[start:start + chunk_rows] = np.linalg.norm(np.asarray(matrix[start:start + chunk_rows], dtype=np.float32), axis=1)
+    norms[norms == 0] = 1.0
+    return norms
+
 def set_torch_threads(n: int):
     """Set torch threads for different operations"""
     try:
@@ -108,34 +720,170 @@ def set_torch_threads(n: int):
     except Exception:
         pass
 
+def _torch_module_bytes(obj) -> int:
+    """Parameter + buffer bytes of a torch module (0 for anything else)."""
+    try:
+        tensors = list(obj.parameters()) + list(obj.buffers())
+    except Exception:
+        return 0
+    return int(sum(t.numel() * t.element_size() for t in tensors))
+
+def process_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+class ModelRegistry:
+    """
+    Loads each model once (concurrent first callers wait on a per-model lock) and records
+    load/warmup times and memory footprint for the readiness report.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._models: Dict[str, Any] = {}
+        self._info: Dict[str, Dict[str, Any]] = {}
+
+    def get_or_load(self, key: str, factory: Callable[[], Any], **meta) -> Any:
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            model = self._models.get(key)
+            if model is not None:
+                return model
+            info = self._info.setdefault(key, {})
+            info.update(meta, status="loading", error=None)
+            started = time.perf_counter()
+            try:
+                model = factory()
+            except Exception as e:
+                info.update(status="failed", error=str(e))
+                raise
+            parts = model if isinstance(model, tuple) else (model,)
+            info.update(
+                status="loaded",
+                load_s=round(time.perf_counter() - started, 3),
+                memory_bytes=sum(_torch_module_bytes(p) for p in parts),
+                loaded_at=time.time(),
+            )
+            self._models[key] = model
+            return model
+
+    def warmup(self, key: str, fn: Callable[[], Any]):
+        started = time.perf_counter()
+        fn()
+        self._info.setdefault(key, {}).update(status="warm", warmup_s=round(time.perf_counter() - started, 3))
+
+    def mark_failed(self, key: str, error: Exception):
+        self._info.setdefault(key, {}).update(status="failed", error=str(error))
+
+    def status(self, key: str) -> str:
+        return self._info.get(key, {}).get("status", "not_loaded")
+
+    def stats(self) -> Dict[str, Any]:
+        return {key: dict(info) for key, info in self._info.items()}
+
+model_registry = ModelRegistry()
+
+def embedding_backend(model_name: str) -> str:
+    # Both values are validated at import
+    return EMBEDDING_BACKEND_LARGE if model_name == LARGE_EMBEDDING_MODEL else EMBEDDING_BACKEND_SMALL
+
+def load_sentence_transformer(model_name: str, backend: str = "fp32"):
+    """
+    fp32: stock PyTorch. int8: Linear layers dynamically quantized to qint8 (weights int8,
+    activations quantized per batch). onnx: ONNX Runtime export via sentence-transformers
+    (needs sentence-transformers>=3.2 and optimum[onnxruntime]).
+    """
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+        try:
+            return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+        except TypeError as e:
+            raise RuntimeError(f"ONNX backend needs sentence-transformers>=3.2: {e}")
+        except ImportError as e:
+            raise RuntimeError(f"ONNX backend needs optimum[onnxruntime]: {e}")
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+        model.eval()
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
 def lazy_load_small_embedder():
-    global _small_embedder
-    if _small_embedder is None:
-        from sentence_transformers import SentenceTransformer
-        _small_embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    return _small_embedder
+    backend = embedding_backend(SMALL_EMBEDDING_MODEL)
+    return model_registry.get_or_load(
+        "small", lambda: load_sentence_transformer(SMALL_EMBEDDING_MODEL, backend), model=SMALL_EMBEDDING_MODEL, backend=backend
+    )
 
 def lazy_load_large_embedder():
-    global _large_embedder
-    if _large_embedder is None:
-        from sentence_transformers import SentenceTransformer
-        _large_embedder = SentenceTransformer("intfloat/e5-large-v2")
-    return _large_embedder
+    backend = embedding_backend(LARGE_EMBEDDING_MODEL)
+    return model_registry.get_or_load(
+        "large", lambda: load_sentence_transformer(LARGE_EMBEDDING_MODEL, backend), model=LARGE_EMBEDDING_MODEL, backend=backend
+    )
+
+def get_embedder(model_name: str):
+    if model_name == LARGE_EMBEDDING_MODEL:
+        return lazy_load_large_embedder()
+    return lazy_load_small_embedder()
+
+def encode_texts(model_name: str, texts: List[str], **kwargs) -> np.ndarray:
+    """Blocking encode; call through cpu_lane from routes."""
+    embedder = get_embedder(model_name)
+    set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
+    return embedder.encode(texts, convert_to_numpy=True, show_progress_bar=False, **kwargs)
+
+_encode_batchers: Dict[str, MicroBatcher] = {}
+_encode_batchers_lock = threading.Lock()
+
+def get_encode_batcher(model_name: str) -> MicroBatcher:
+    with _encode_batchers_lock:
+        batcher = _encode_batchers.get(model_name)
+        if batcher is None:
+            batcher = MicroBatcher(
+                name=model_name.split("/")[-1],
+                process_fn=functools.partial(encode_texts, model_name),
+                max_batch=EMBED_BATCH_MAX_SIZE,
+                max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+            )
+            _encode_batchers[model_name] = batcher
+        return batcher
+
+async def encode_batched(model_name: str, texts: List[str], **kwargs) -> np.ndarray:
+    """Encode through the per-model micro-batching queue; does not block the event loop."""
+    return await get_encode_batcher(model_name).run(texts, **kwargs)
+
+async def embed_query(model_name: str, query: str) -> np.ndarray:
+    """Query vector for `model_name`, served from query_embedding_cache when possible."""
+    # Backends give slightly different vectors, so they never share cache entries
+    cache_model = f"{model_name}@{embedding_backend(model_name)}"
+    vec = query_embedding_cache.get(cache_model, query)
+    if vec is None:
+        vec = (await encode_batched(model_name, [query]))[0]
+        query_embedding_cache.put(cache_model, query, vec)
+    return vec
 
 def lazy_load_blip():
-    global _blip_processor, _blip_model
-    if _blip_processor is None or _blip_model is None:
+    def load():
         from transformers import BlipProcessor, BlipForConditionalGeneration
         model_name = os.environ.get("BLIP_MODEL", "Salesforce/blip-image-captioning-large")
-        _blip_processor = BlipProcessor.from_pretrained(model_name)
-        _blip_model = BlipForConditionalGeneration.from_pretrained(model_name)
+        processor = BlipProcessor.from_pretrained(model_name)
+        model = BlipForConditionalGeneration.from_pretrained(model_name)
         try:
             import torch
-            _blip_model.to("cpu")
-            _blip_model.eval()
+            model.to("cpu")
+            model.eval()
         except Exception:
             pass
-    return _blip_processor, _blip_model
+        return processor, model
+    return model_registry.get_or_load("blip", load)
 
 def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
     try:
@@ -148,6 +896,134 @@ def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
     except Exception as e:
         raise RuntimeError(f"PDF text extraction failed: {e}")
 
+# --------------------- HTTP backends: keep-alive sessions + circuit breakers ---------------------
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", str(max(10, IO_WORKERS))))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_PROBE_INTERVAL = float(os.environ.get("BREAKER_PROBE_INTERVAL", "10"))
+
+_http_sessions: Dict[str, requests.Session] = {}
+_http_sessions_lock = threading.Lock()
+
+def http_session(backend: str) -> requests.Session:
+    """One keep-alive connection pool per backend, shared by all threads."""
+    with _http_sessions_lock:
+        session = _http_sessions.get(backend)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_sessions[backend] = session
+        return session
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; while open, allow() is False so callers
+    go straight to their fallback. A background thread probes `probe_url` every `probe_interval`
+    seconds and closes the breaker once the backend answers again.
+    """
+
+    def __init__(self, name: str, probe_url: Optional[str], failure_threshold: int, probe_interval: float):
+        self.name = name
+        self.probe_url = probe_url
+        self.failure_threshold = max(1, failure_threshold)
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        self._probe_thread: Optional[threading.Thread] = None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                self.rejected += 1
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self.opened_at = None
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:200]
+            if self.state == "open" or self.consecutive_failures < self.failure_threshold:
+                return
+            self.state = "open"
+            self.opened_at = time.time()
+            self.trips += 1
+            if self._probe_thread is None or not self._probe_thread.is_alive():
+                self._probe_thread = threading.Thread(target=self._probe_loop, name=f"{self.name}-probe", daemon=True)
+                self._probe_thread.start()
+        print(f"Circuit breaker '{self.name}' opened after {self.consecutive_failures} failures: {error}")
+
+    @contextlib.contextmanager
+    def track(self):
+        try:
+            yield
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self.state != "open":
+                    return
+            try:
+                # Any non-5xx answer means the service is reachable again
+                resp = http_session(self.name).get(self.probe_url, timeout=(HTTP_CONNECT_TIMEOUT, 5))
+                healthy = resp.status_code < 500
+            except Exception as e:
+                healthy = False
+                self.last_error = str(e)[:200]
+            if healthy:
+                print(f"Circuit breaker '{self.name}' closed: probe succeeded")
+                self.record_success()
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_at": self.opened_at,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+            "probe_url": self.probe_url,
+        }
+
+def _default_probe_url(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+pixtral_breaker = CircuitBreaker(
+    "pixtral", os.environ.get("PIXTRAL_HEALTH_URL") or _default_probe_url(PIXTRAL_HTTP_URL),
+    BREAKER_FAILURE_THRESHOLD, BREAKER_PROBE_INTERVAL,
+)
+ollama_breaker = CircuitBreaker(
+    "ollama", os.environ.get("OLLAMA_HEALTH_URL") or _default_probe_url(OLLAMA_HTTP_URL),
+    BREAKER_FAILURE_THRESHOLD, BREAKER_PROBE_INTERVAL,
+)
+
+def pixtral_available() -> bool:
+    return bool(PIXTRAL_HTTP_URL) and pixtral_breaker.allow()
+
+def ollama_available() -> bool:
+    return bool(OLLAMA_HTTP_URL) and ollama_breaker.allow()
+
 def call_pixtral_http(image_bytes: Optional[bytes], pdf_text: Optional[str], system_prompt: str, user_prompt: str) -> Dict[str, Any]:
     if not PIXTRAL_HTTP_URL:
         raise RuntimeError("PIXTRAL_HTTP_URL not configured")
@@ -159,24 +1035,657 @@ def call_pixtral_http(image_bytes: Optional[bytes], pdf_text: Optional[str], sys
     }
     if image_bytes:
         payload["image_bytes_base64"] = base64.b64encode(image_bytes).decode("ascii")
-    resp = requests.post(PIXTRAL_HTTP_URL, json=payload, timeout=60)
+    with pixtral_breaker.track():
+        resp = http_session("pixtral").post(PIXTRAL_HTTP_URL, json=payload, timeout=(HTTP_CONNECT_TIMEOUT, 60))
+        if resp.status_code >= 500:
+            raise RuntimeError(f"Pixtral HTTP call failed: {resp.status_code} {resp.text}")
     if resp.status_code != 200:
         raise RuntimeError(f"Pixtral HTTP call failed: {resp.status_code} {resp.text}")
     return resp.json()
 
-def caption_with_blip(image_bytes: bytes, caption_instructions: Optional[str] = None) -> Dict[str, Any]:
+# --------------------- Image preprocessing (decode once, downscale to model size) ---------------------
+class PreparedImage:
+    """
+    One decoded upload. The image is decoded a single time (JPEG via Image.draft at a reduced
+    DCT scale) at the smallest size that still serves every model, and the per-model variants
+    are computed on first use and kept for the rest of the request.
+    """
+
+    def __init__(self, data: bytes, image: Image.Image, source_format: Optional[str], source_size: Tuple[int, int]):
+        self.data = data
+        self.image = image
+        self.source_format = source_format
+        self.source_size = source_size
+        self._blip: Optional[Image.Image] = None
+        self._pixtral: Optional[bytes] = None
+        self._sha256: Optional[str] = None
+        self._dhash: Optional[int] = None
+        self.analysis_key: Optional[str] = None  # image analysis cache entry this upload resolved to
+
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    def dhash(self) -> int:
+        """64-bit difference hash: stable across re-encoding and resizing, for near-duplicate lookup."""
+        if self._dhash is None:
+            pixels = np.asarray(self.image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+            bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+            self._dhash = int("".join("1" if b else "0" for b in bits), 2)
+        return self._dhash
+
+    def blip_image(self) -> Image.Image:
+        # BLIP's processor squashes to BLIP_IMAGE_SIZE x BLIP_IMAGE_SIZE; keep the short side at that size
+        if self._blip is None:
+            w, h = self.image.size
+            scale = BLIP_IMAGE_SIZE / min(w, h)
+            if scale < 1:
+                self._blip = self.image.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BICUBIC)
+            else:
+                self._blip = self.image
+        return self._blip
+
+    def pixtral_bytes(self) -> bytes:
+        if self._pixtral is None:
+            w, h = self.source_size
+            if self.source_format == "JPEG" and max(w, h) <= PIXTRAL_IMAGE_MAX_SIDE:
+                self._pixtral = self.data  # already small and compressed; send as is
+            else:
+                img = self.image.copy()
+                img.thumbnail((PIXTRAL_IMAGE_MAX_SIDE, PIXTRAL_IMAGE_MAX_SIDE), Image.BICUBIC)
+                buf = io.BytesIO()
+                img.save(buf, format="JPEG", quality=PIXTRAL_JPEG_QUALITY)
+                self._pixtral = buf.getvalue()
+        return self._pixtral
+
+def check_image_bytes(size: int):
+    if size > IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image is {size} bytes; limit is {IMAGE_MAX_BYTES}")
+
+def decode_b64_image(image_b64: str) -> bytes:
+    # Reject on the encoded length first so oversized bodies are never decoded
+    check_image_bytes(len(image_b64) * 3 // 4)
+    try:
+        import base64
+        return base64.b64decode(image_b64)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {e}")
+
+def prepare_image(data: bytes) -> PreparedImage:
+    """Blocking: validate caps from the header, then decode once at the largest size any model needs."""
+    check_image_bytes(len(data))
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported or corrupt image: {e}")
+    w, h = img.size
+    if w * h > IMAGE_MAX_PIXELS:
+        raise HTTPException(status_code=413, detail=f"Image is {w}x{h} pixels; limit is {IMAGE_MAX_PIXELS}")
+    source_format = img.format
+    # Smallest scale that keeps BLIP's short side and Pixtral's long side at full resolution
+    needed = max(BLIP_IMAGE_SIZE / min(w, h), (PIXTRAL_IMAGE_MAX_SIDE / max(w, h)) if PIXTRAL_HTTP_URL else 0.0)
+    scale = min(1.0, needed)
+    try:
+        img.draft("RGB", (max(1, int(w * scale + 0.5)), max(1, int(h * scale + 0.5))))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported or corrupt image: {e}")
+    return PreparedImage(data, img, source_format, (w, h))
+
+async def prepare_images(images: List[bytes]) -> List[PreparedImage]:
+    return await cpu_lane.run(lambda: [prepare_image(data) for data in images])
+
+async def describe_images(images: List[PreparedImage], system_prompt: str, user_prompt: str) -> List[Dict[str, Any]]:
+    """
+    Pixtral (one concurrent call per image) when configured and its breaker is closed;
+    BLIP for the rest, through the shared batching queue so captions run at batch width.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(images)
+    use_pixtral = pixtral_available()
+    if IMAGE_CACHE_ENABLED:
+        backend, prompt = image_analysis_backend(use_pixtral), image_analysis_prompt(use_pixtral, system_prompt, user_prompt)
+        cached = await io_lane.run(lambda: [image_cache.lookup(image, backend, prompt) for image in images])
+        for i, hit in enumerate(cached):
+            results[i] = hit
+    fresh: List[Tuple[int, bool]] = []  # (index, produced by Pixtral)
+    if use_pixtral:
+        todo = [i for i, r in enumerate(results) if r is None]
+        payloads = await cpu_lane.run(lambda: [images[i].pixtral_bytes() for i in todo])
+        outs = await asyncio.gather(
+            *(io_lane.run(call_pixtral_http, payload, None, system_prompt, user_prompt) for payload in payloads),
+            return_exceptions=True,
+        )
+        for i, out in zip(todo, outs):
+            if isinstance(out, Exception):
+                print(f"Pixtral HTTP call failed, falling back to BLIP: {out}")
+            else:
+                results[i] = out
+                fresh.append((i, True))
+    pending = [i for i, r in enumerate(results) if r is None]
+    if pending:
+        # Images are already decoded, so one corrupt upload cannot fail a shared batch
+        resized = await cpu_lane.run(lambda: [images[i].blip_image() for i in pending])
+        for i, out in zip(pending, await blip_batcher.run(resized)):
+            results[i] = out
+            fresh.append((i, False))
+    if IMAGE_CACHE_ENABLED and fresh:
+        def store():
+            for i, by_pixtral in fresh:
+                image_cache.store(
+                    images[i], image_analysis_backend(by_pixtral),
+                    image_analysis_prompt(by_pixtral, system_prompt, user_prompt), results[i],
+                )
+        try:
+            await io_lane.run(store)
+        except Exception as e:
+            print(f"Image analysis cache write failed: {e}")
+    return results
+
+async def embed_image_descriptions(images: List[PreparedImage], descriptions: List[str]) -> np.ndarray:
+    """SMALL_EMBEDDING_MODEL vectors for image descriptions, reusing ones stored with the cached analysis."""
+    model_id = f"{SMALL_EMBEDDING_MODEL}@{embedding_backend(SMALL_EMBEDDING_MODEL)}"
+    vectors: List[Optional[np.ndarray]] = [None] * len(images)
+    if IMAGE_CACHE_ENABLED:
+        vectors = await io_lane.run(lambda: [image_cache.get_embedding(image.analysis_key, model_id) for image in images])
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        encoded = await encode_batched(SMALL_EMBEDDING_MODEL, [descriptions[i] for i in missing])
+        for i, vec in zip(missing, encoded):
+            vectors[i] = np.asarray(vec, dtype=np.float32)
+        if IMAGE_CACHE_ENABLED:
+            def store():
+                for i in missing:
+                    image_cache.set_embedding(images[i].analysis_key, model_id, vectors[i])
+            try:
+                await io_lane.run(store)
+            except Exception as e:
+                print(f"Image embedding cache write failed: {e}")
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(vectors)
+
+async def describe_image(image: PreparedImage, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+    """Pixtral when configured and its breaker is closed, BLIP otherwise (or if Pixtral fails)."""
+    return (await describe_images([image], system_prompt, user_prompt))[0]
+
+def caption_images_with_blip(images: List[Image.Image]) -> List[Dict[str, Any]]:
+    """One padded BLIP generate() over a batch of RGB images."""
     processor, model = lazy_load_blip()
     import torch
     set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for image processing
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    inputs = processor(images=img, return_tensors="pt")
+    inputs = processor(images=images, return_tensors="pt")
     with torch.no_grad():
         out_ids = model.generate(**inputs, max_new_tokens=64)
-    caption = processor.decode(out_ids[0], skip_special_tokens=True)
-    return {"caption": caption, "short_answer": caption, "objects": []}
+    captions = processor.batch_decode(out_ids, skip_special_tokens=True)
+    return [{"caption": caption, "short_answer": caption, "objects": []} for caption in captions]
+
+blip_batcher = MicroBatcher(
+    name="blip",
+    process_fn=caption_images_with_blip,
+    max_batch=BLIP_BATCH_MAX_SIZE,
+    max_wait_ms=BLIP_BATCH_MAX_WAIT_MS,
+)
+
+def caption_with_blip(image_bytes: bytes, caption_instructions: Optional[str] = None) -> Dict[str, Any]:
+    return caption_images_with_blip([prepare_image(image_bytes).blip_image()])[0]
+
+# --------------------- Model preload / readiness ---------------------
+def _warmup_image_bytes() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), (127, 127, 127)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+# name -> (loader, warmup inference)
+PRELOADABLE_MODELS: Dict[str, Tuple[Callable[[], Any], Callable[[], Any]]] = {
+    "small": (lazy_load_small_embedder, lambda: encode_texts(SMALL_EMBEDDING_MODEL, ["warmup"])),
+    "large": (lazy_load_large_embedder, lambda: encode_texts(LARGE_EMBEDDING_MODEL, ["warmup"])),
+    "blip": (lazy_load_blip, lambda: caption_with_blip(_warmup_image_bytes())),
+}
+
+_preload_done = threading.Event()
+
+def preload_models(names: List[str]):
+    """Load and warm each requested model in order; failures are recorded, not raised."""
+    try:
+        for name in names:
+            if name not in PRELOADABLE_MODELS:
+                print(f"Unknown model in MODEL_PRELOAD: {name!r} (expected one of {sorted(PRELOADABLE_MODELS)})")
+                continue
+            loader, warm = PRELOADABLE_MODELS[name]
+            try:
+                loader()
+                model_registry.warmup(name, warm)
+                print(f"✅ Preloaded {name}: {model_registry.stats()[name]}")
+            except Exception as e:
+                model_registry.mark_failed(name, e)
+                print(f"❌ Preloading {name} failed: {e}")
+    finally:
+        _preload_done.set()
+
+def readiness() -> Dict[str, Any]:
+    wanted = [n for n in MODEL_PRELOAD if n in PRELOADABLE_MODELS]
+    ready = _preload_done.is_set() and all(model_registry.status(n) == "warm" for n in wanted)
+    return {
+        "ready": ready,
+        "preload": wanted,
+        "preload_finished": _preload_done.is_set(),
+        "models": model_registry.stats(),
+        "process_rss_bytes": process_rss_bytes(),
+    }
+
+# --------------------- Registered prompt prefixes (KV reuse) ---------------------
+# name -> fixed leading prompt text. Prompts that start with a registered prefix can resume from
+# its saved KV state, so llama.cpp only evaluates the variable tail.
+PROMPT_PREFIXES: Dict[str, str] = {}
+
+def register_prompt_prefix(name: str, text: str) -> str:
+    PROMPT_PREFIXES[name] = text
+    return text
+
+def resolve_prompt_prefix(name: Optional[str], prompt: str) -> Optional[str]:
+    """The prefix name if it is registered and `prompt` really starts with it, else None."""
+    if not LLAMA_PREFIX_CACHE_ENABLED or not name:
+        return None
+    text = PROMPT_PREFIXES.get(name)
+    return name if text and prompt.startswith(text) else None
+
+def prefix_state_name(name: str, suffix: str) -> str:
+    # Saved state is only valid for the same model, context size and prefix text
+    digest = hashlib.sha1(
+        f"{os.path.basename(MISTRAL_GGUF)}|{LLAMA_POOL_SLOT_CTX}|{PROMPT_PREFIXES[name]}".encode("utf-8")
+    ).hexdigest()[:12]
+    return f"{name}-{digest}{suffix}"
+
+# --------------------- Resident llama.cpp worker pool ---------------------
+class LlamaWorker:
+    """
+    One long-lived llama-server process holding the Mistral GGUF in memory.
+    The port is shared by every server process on the host: whoever holds the port's lock file
+    (under OMNIMIND_STATE_DIR) runs and restarts llama-server, the others attach to it over HTTP.
+    """
+
+    def __init__(self, index: int, port: int, threads: int, slots: int):
+        self.index = index
+        self.port = port
+        self.threads = threads
+        self.slots = slots
+        self.url = f"http://127.0.0.1:{port}"
+        self.lock_path = os.path.join(LLAMA_POOL_LOCK_DIR, f"port-{port}.lock")
+        self._lock_file = None
+        self.proc: Optional[subprocess.Popen] = None
+        self.ready = False
+        self.restarts = 0
+        self.started_at = 0.0
+        self.next_restart_at = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def owned(self) -> bool:
+        return self._lock_file is not None
+
+    def try_own(self) -> bool:
+        """Take over management of this port if no live process holds it (the lock dies with its holder)."""
+        if self._lock_file is not None:
+            return True
+        os.makedirs(LLAMA_POOL_LOCK_DIR, exist_ok=True)
+        f = open(self.lock_path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
 
-def run_mistral_llama_cpp(prompt: str, threads: int = MISTRAL_THREADS, max_tokens: int = 512) -> str:
-    """Updated to use correct llama-cli arguments for your build - uses 30 cores"""
+    def release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()  # closing drops the flock
+            self._lock_file = None
+
+    def start(self):
+        cmd = [
+            LLAMA_SERVER_BIN,
+            "-m", MISTRAL_GGUF,
+            "--host", "127.0.0.1",
+            "--port", str(self.port),
+            "--threads", str(self.threads),
+            "-c", str(LLAMA_POOL_SLOT_CTX * self.slots),
+            "--parallel", str(self.slots),
+            "--cont-batching",
+        ]
+        if LLAMA_PREFIX_CACHE_ENABLED:
+            os.makedirs(LLAMA_SLOT_SAVE_PATH, exist_ok=True)
+            cmd += ["--slot-save-path", LLAMA_SLOT_SAVE_PATH]
+        log_path = os.path.join(tempfile.gettempdir(), f"llama-worker-{self.index}.log")
+        with open(log_path, "ab") as log:
+            self.proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        self.ready = False
+        self.started_at = time.time()
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def check_health(self) -> bool:
+        # llama-server answers 503 while the model is still loading
+        try:
+            resp = http_session("llama").get(f"{self.url}/health", timeout=2)
+            self.ready = resp.status_code == 200
+        except Exception as e:
+            self.ready = False
+            self.last_error = str(e)
+        return self.ready
+
+    def stop(self):
+        self.ready = False
+        if self.proc is not None:
+            try:
+                self.proc.terminate()
+                self.proc.wait(timeout=10)
+            except Exception:
+                try:
+                    self.proc.kill()
+                except Exception:
+                    pass
+            self.proc = None
+        self.release()
+
+class LlamaServerPool:
+    """
+    Keeps LLAMA_POOL_WORKERS llama-server processes resident, restarts them when
+    they crash and hands out (worker, slot) pairs so several generations run at once.
+    One pool serves the whole host: with several uvicorn workers, each port is run by the
+    process holding its lock and the rest attach to it (taking over if the owner exits).
+    Requests for a registered prompt prefix prefer a slot whose KV cache already holds
+    it; otherwise the prefix state is restored from (or primed and saved to) the slot
+    save path before the request runs.
+    """
+
+    def __init__(self, workers: int, slots: int, base_port: int):
+        threads = max(1, MISTRAL_THREADS // max(1, workers))
+        self.workers = [LlamaWorker(i, base_port + i, threads, slots) for i in range(workers)]
+        self._free: List[Tuple[int, int]] = [(w.index, slot_id) for w in self.workers for slot_id in range(slots)]
+        self._free_cond = threading.Condition()
+        # Registered prefix each slot's KV cache currently starts with (None = unknown/other)
+        self._slot_prefix: Dict[Tuple[int, int], Optional[str]] = {}
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        self.started = False
+        self.completed = 0
+        self.failed = 0
+        self.prefix_affinity_hits = 0
+        self.prefix_restores = 0
+        self.prefix_saves = 0
+
+    def start(self):
+        if self.started:
+            return
+        if not os.path.exists(LLAMA_SERVER_BIN):
+            print(f"llama-server not found at {LLAMA_SERVER_BIN}; using per-request llama-cli instead")
+            return
+        for w in self.workers:
+            if w.try_own() and not w.check_health():
+                w.start()
+        self.started = True
+        self._monitor = threading.Thread(target=self._monitor_loop, name="llama-pool-monitor", daemon=True)
+        self._monitor.start()
+
+    def shutdown(self):
+        self._stop.set()
+        for w in self.workers:
+            w.stop()
+        self.started = False
+
+    def _monitor_loop(self):
+        while not self._stop.is_set():
+            for w in self.workers:
+                if not w.try_own() or w.alive():
+                    # Attached to a sibling's server, or our own process is running
+                    w.check_health()
+                    continue
+                if w.proc is None and w.check_health():
+                    # Adopted a server left running by a previous owner
+                    continue
+                w.ready = False
+                now = time.time()
+                if now < w.next_restart_at:
+                    continue
+                code = w.proc.returncode if w.proc is not None else None
+                print(f"llama-server worker {w.index} not running (code={code}); starting")
+                w.restarts += 1
+                # Back off when a worker keeps crashing (bad model path, OOM, port in use)
+                w.next_restart_at = now + min(60.0, 2.0 ** min(w.restarts, 6))
+                try:
+                    w.start()
+                except Exception as e:
+                    w.last_error = str(e)
+            self._stop.wait(LLAMA_POOL_HEALTH_INTERVAL)
+
+    def available(self) -> bool:
+        return self.started and any(w.ready for w in self.workers)
+
+    def capacity(self) -> int:
+        return sum(w.slots for w in self.workers if w.ready)
+
+    def _acquire(self, timeout: float, prefix: Optional[str] = None) -> Tuple[LlamaWorker, int]:
+        deadline = time.time() + timeout
+        with self._free_cond:
+            while True:
+                # Slots of workers that are down or still loading stay parked in the free list
+                ready = [key for key in self._free if self.workers[key[0]].ready]
+                if ready:
+                    matching = [key for key in ready if prefix and self._slot_prefix.get(key) == prefix]
+                    # Prefer a slot already holding this prefix, then one not holding any other prefix
+                    key = (matching or [k for k in ready if self._slot_prefix.get(k) is None] or ready)[0]
+                    self._free.remove(key)
+                    if matching:
+                        self.prefix_affinity_hits += 1
+                    return self.workers[key[0]], key[1]
+                if not self.available():
+                    raise RuntimeError("No healthy llama.cpp workers")
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise RuntimeError("No free llama.cpp slot within timeout")
+                self._free_cond.wait(min(remaining, 0.05))
+
+    def _release(self, worker: LlamaWorker, slot_id: int, prefix: Optional[str] = None):
+        with self._free_cond:
+            self._slot_prefix[(worker.index, slot_id)] = prefix
+            self._free.append((worker.index, slot_id))
+            self._free_cond.notify()
+
+    def _slot_action(self, worker: LlamaWorker, slot_id: int, action: str, filename: str):
+        resp = http_session("llama").post(
+            f"{worker.url}/slots/{slot_id}", params={"action": action}, json={"filename": filename}, timeout=60
+        )
+        if resp.status_code != 200:
+            raise RuntimeError(f"slot {action} {resp.status_code}: {resp.text[:200]}")
+
+    def _load_prefix(self, worker: LlamaWorker, slot_id: int, prefix: Optional[str]):
+        """Make the slot's KV cache start with `prefix`: restore saved state, or evaluate once and save it."""
+        if prefix is None or self._slot_prefix.get((worker.index, slot_id)) == prefix:
+            return
+        filename = prefix_state_name(prefix, ".bin")
+        try:
+            if os.path.exists(os.path.join(LLAMA_SLOT_SAVE_PATH, filename)):
+                self._slot_action(worker, slot_id, "restore", filename)
+                self.prefix_restores += 1
+                return
+            payload = {"prompt": PROMPT_PREFIXES[prefix], "n_predict": 0, "id_slot": slot_id, "cache_prompt": True}
+            resp = http_session("llama").post(f"{worker.url}/completion", json=payload, timeout=180)
+            if resp.status_code != 200:
+                raise RuntimeError(f"prefix prime {resp.status_code}: {resp.text[:200]}")
+            self._slot_action(worker, slot_id, "save", filename)
+            self.prefix_saves += 1
+        except Exception as e:
+            # Only an optimization: the request still runs, evaluating the full prompt
+            print(f"llama-server prefix state '{prefix}' unavailable on worker {worker.index}: {e}")
+
+    def generate(self, prompt: str, max_tokens: int = 512, timeout: float = 180, prefix: Optional[str] = None) -> str:
+        prefix = resolve_prompt_prefix(prefix, prompt)
+        worker, slot_id = self._acquire(LLAMA_POOL_ACQUIRE_TIMEOUT, prefix)
+        self._load_prefix(worker, slot_id, prefix)
+        payload = {
+            "prompt": prompt,
+            "n_predict": max_tokens,
+            "temperature": 0.7,
+            "top_k": 40,
+            "top_p": 0.95,
+            "repeat_penalty": 1.1,
+            "id_slot": slot_id,
+            "cache_prompt": True,
+        }
+        try:
+            resp = http_session("llama").post(f"{worker.url}/completion", json=payload, timeout=timeout)
+            if resp.status_code != 200:
+                raise RuntimeError(f"llama-server {resp.status_code}: {resp.text[:200]}")
+            self.completed += 1
+            return (resp.json().get("content") or "").strip()
+        except requests.ConnectionError as e:
+            worker.ready = False
+            worker.last_error = str(e)
+            self.failed += 1
+            raise RuntimeError(f"llama-server worker {worker.index} unreachable: {e}")
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._release(worker, slot_id, prefix)
+
+    def stream(self, prompt: str, max_tokens: int = 512, timeout: float = 180, prefix: Optional[str] = None):
+        """Yield generated text pieces as llama-server produces them (SSE from /completion)."""
+        prefix = resolve_prompt_prefix(prefix, prompt)
+        worker, slot_id = self._acquire(LLAMA_POOL_ACQUIRE_TIMEOUT, prefix)
+        self._load_prefix(worker, slot_id, prefix)
+        payload = {
+            "prompt": prompt,
+            "n_predict": max_tokens,
+            "temperature": 0.7,
+            "top_k": 40,
+            "top_p": 0.95,
+            "repeat_penalty": 1.1,
+            "id_slot": slot_id,
+            "cache_prompt": True,
+            "stream": True,
+        }
+        try:
+            with http_session("llama").post(f"{worker.url}/completion", json=payload, timeout=timeout, stream=True) as resp:
+                if resp.status_code != 200:
+                    raise RuntimeError(f"llama-server {resp.status_code}: {resp.text[:200]}")
+                for line in resp.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[5:].strip())
+                    if chunk.get("content"):
+                        yield chunk["content"]
+                    if chunk.get("stop"):
+                        break
+            self.completed += 1
+        except requests.ConnectionError as e:
+            worker.ready = False
+            worker.last_error = str(e)
+            self.failed += 1
+            raise RuntimeError(f"llama-server worker {worker.index} unreachable: {e}")
+        except GeneratorExit:
+            # Client went away; closing the response makes llama-server stop generating
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._release(worker, slot_id, prefix)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": LLAMA_POOL_ENABLED,
+            "started": self.started,
+            "free_slots": len(self._free),
+            "prefix_cache": {
+                "enabled": LLAMA_PREFIX_CACHE_ENABLED,
+                "registered": sorted(PROMPT_PREFIXES),
+                "affinity_hits": self.prefix_affinity_hits,
+                "restores": self.prefix_restores,
+                "saves": self.prefix_saves,
+            },
+            "completed": self.completed,
+            "failed": self.failed,
+            "workers": [
+                {
+                    "index": w.index,
+                    "port": w.port,
+                    "pid": w.proc.pid if w.proc is not None else None,
+                    "owned": w.owned,
+                    "alive": w.alive(),
+                    "ready": w.ready,
+                    "slots": w.slots,
+                    "threads": w.threads,
+                    "restarts": w.restarts,
+                    "last_error": w.last_error,
+                }
+                for w in self.workers
+            ],
+        }
+
+llama_pool = LlamaServerPool(LLAMA_POOL_WORKERS, LLAMA_POOL_SLOTS, LLAMA_POOL_BASE_PORT)
+
+# One lock per prefix: only the first llama-cli run for a prefix writes its prompt cache file
+_prompt_cache_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+def prompt_cache_args(prefix: Optional[str]) -> Tuple[List[str], Optional[threading.Lock]]:
+    """
+    llama-cli flags for reusing a registered prefix's evaluated state. The first run writes the
+    cache file (holding the returned lock); later runs load it read-only, so llama-cli only
+    evaluates the tokens after the longest common prefix.
+    """
+    if prefix is None:
+        return [], None
+    path = os.path.join(LLAMA_PROMPT_CACHE_DIR, prefix_state_name(prefix, ".cache"))
+    if os.path.exists(path):
+        return ["--prompt-cache", path, "--prompt-cache-ro"], None
+    lock = _prompt_cache_locks[prefix]
+    if not lock.acquire(blocking=False):
+        # Another run is writing it right now; don't wait for it
+        return [], None
+    if os.path.exists(path):
+        lock.release()
+        return ["--prompt-cache", path, "--prompt-cache-ro"], None
+    os.makedirs(LLAMA_PROMPT_CACHE_DIR, exist_ok=True)
+    return ["--prompt-cache", path], lock
+
+# Model id of the backend that produced the last generation on this thread; with the Ollama
+# breaker open, generations fall back to llama.cpp, and caches must not file those under Ollama
+_llm_served = threading.local()
+
+def llm_model_id(backend: str) -> str:
+    if backend == "ollama":
+        return f"ollama:{OLLAMA_MODEL_MISTRAL}"
+    return f"llama.cpp:{os.path.basename(MISTRAL_GGUF)}"
+
+def _record_served(backend: str):
+    _llm_served.model = llm_model_id(backend)
+
+def run_llm_recorded(fn, *args, **kwargs) -> Tuple[Any, Optional[str]]:
+    """Call a blocking generation function; returns (result, model id of the backend that answered)."""
+    _llm_served.model = None
+    result = fn(*args, **kwargs)
+    return result, getattr(_llm_served, "model", None)
+
+def stream_llm_recorded(served: Dict[str, Optional[str]], *args, **kwargs):
+    """stream_mistral that stores the serving backend's model id in `served` once the stream ends."""
+    _llm_served.model = None
+    yield from stream_mistral(*args, **kwargs)
+    served["model"] = getattr(_llm_served, "model", None)
+
+def run_mistral_llama_cpp(prompt: str, threads: int = MISTRAL_THREADS, max_tokens: int = 512, prefix: Optional[str] = None) -> str:
+    """Uses the resident llama-server pool when it is up, otherwise spawns llama-cli - uses 30 cores"""
+    _record_served("llama.cpp")
+    prefix = resolve_prompt_prefix(prefix, prompt)
+    if llama_pool.available():
+        try:
+            return llama_pool.generate(prompt, max_tokens=max_tokens, prefix=prefix)
+        except Exception as e:
+            print(f"llama.cpp pool call failed, falling back to llama-cli: {e}")
+    cache_args, cache_lock = prompt_cache_args(prefix)
     cmd = [
         LLAMA_CPP_BIN, 
         "-m", MISTRAL_GGUF, 
@@ -186,6 +1695,7 @@ def run_mistral_llama_cpp(prompt: str, threads: int = MISTRAL_THREADS, max_token
         "--temp", "0.7", 
         "--top-k", "40", 
         "--top-p", "0.95", 
+        *cache_args,
         "-p", prompt
     ]
     try:
@@ -201,29 +1711,164 @@ def run_mistral_llama_cpp(prompt: str, threads: int = MISTRAL_THREADS, max_token
         return "Error: Mistral inference timed out."
     except FileNotFoundError:
         raise RuntimeError(f"llama.cpp binary not found at {LLAMA_CPP_BIN}. Set LLAMA_CPP_BIN env var.")
+    finally:
+        if cache_lock is not None:
+            cache_lock.release()
 
 def run_mistral_via_http(prompt: str, model: str = OLLAMA_MODEL_MISTRAL) -> str:
     if not OLLAMA_HTTP_URL:
         raise RuntimeError("OLLAMA_HTTP_URL not configured")
     payload = {"model": model, "prompt": prompt}
-    resp = requests.post(OLLAMA_HTTP_URL, json=payload, timeout=60)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Inference HTTP call failed: {resp.status_code} {resp.text}")
+    with ollama_breaker.track():
+        resp = http_session("ollama").post(OLLAMA_HTTP_URL, json=payload, timeout=(HTTP_CONNECT_TIMEOUT, 60))
+        if resp.status_code != 200:
+            raise RuntimeError(f"Inference HTTP call failed: {resp.status_code} {resp.text}")
     data = resp.json()
+    _record_served("ollama")
     return data.get("output") or data.get("result") or json.dumps(data)
 
-def run_mistral(prompt: str) -> str:
-    if OLLAMA_HTTP_URL:
+def run_mistral(prompt: str, prefix: Optional[str] = None) -> str:
+    """`prefix` names a registered prompt prefix for KV reuse on llama.cpp (Ollama keeps its own prompt cache)."""
+    if ollama_available():
         try:
             return run_mistral_via_http(prompt)
         except Exception as e:
             print(f"OLLAMA HTTP call failed, falling back to llama.cpp: {e}")
-    return run_mistral_llama_cpp(prompt)
+    return run_mistral_llama_cpp(prompt, prefix=prefix)
+
+def run_mistral_max(prompt: str, max_tokens: int = 1024, prefix: Optional[str] = None) -> str:
+    if not OLLAMA_HTTP_URL:
+        return run_mistral_llama_cpp(prompt, threads=MISTRAL_THREADS, max_tokens=max_tokens, prefix=prefix)
+    return run_mistral(prompt, prefix=prefix)
 
-def run_mistral_max(prompt: str, max_tokens: int = 1024) -> str:
+# --------------------- Token streaming ---------------------
+def stream_mistral_via_http(prompt: str, model: str = OLLAMA_MODEL_MISTRAL):
+    """Ollama-style NDJSON stream: one JSON object per line with the next text piece."""
     if not OLLAMA_HTTP_URL:
-        return run_mistral_llama_cpp(prompt, threads=MISTRAL_THREADS, max_tokens=max_tokens)
-    return run_mistral(prompt)
+        raise RuntimeError("OLLAMA_HTTP_URL not configured")
+    payload = {"model": model, "prompt": prompt, "stream": True}
+    with ollama_breaker.track():
+        resp = http_session("ollama").post(OLLAMA_HTTP_URL, json=payload, timeout=(HTTP_CONNECT_TIMEOUT, 60), stream=True)
+        if resp.status_code != 200:
+            resp.close()
+            raise RuntimeError(f"Inference HTTP call failed: {resp.status_code} {resp.text}")
+    with resp:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            data = json.loads(line)
+            piece = data.get("response") or data.get("output") or data.get("token") or ""
+            if piece:
+                yield piece
+            if data.get("done"):
+                break
+
+def stream_mistral(prompt: str, max_tokens: int = 512, prefix: Optional[str] = None):
+    """
+    Blocking generator of answer text pieces, with the same backend order as run_mistral:
+    Ollama-compatible HTTP, then the llama-server pool, then one-shot llama-cli.
+    """
+    if ollama_available():
+        produced = False
+        try:
+            for piece in stream_mistral_via_http(prompt):
+                produced = True
+                yield piece
+            _record_served("ollama")
+            return
+        except Exception as e:
+            if produced:
+                raise
+            print(f"OLLAMA HTTP stream failed, falling back to llama.cpp: {e}")
+    if llama_pool.available():
+        produced = False
+        try:
+            for piece in llama_pool.stream(prompt, max_tokens=max_tokens, prefix=prefix):
+                produced = True
+                yield piece
+            _record_served("llama.cpp")
+            return
+        except Exception as e:
+            if produced:
+                raise
+            print(f"llama.cpp pool stream failed, falling back to llama-cli: {e}")
+    # llama-cli cannot stream through subprocess.run; emit the whole answer at once
+    yield run_mistral_llama_cpp(prompt, threads=MISTRAL_THREADS, max_tokens=max_tokens, prefix=prefix)
+
+async def stream_llm_tokens(gen_fn, *args, **kwargs):
+    """Run a blocking token generator on llm_lane and yield its pieces to the event loop."""
+    loop = asyncio.get_running_loop()
+    pieces: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        gen = iter(gen_fn(*args, **kwargs))
+        try:
+            for piece in gen:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(pieces.put_nowait, piece)
+        except Exception as e:
+            loop.call_soon_threadsafe(pieces.put_nowait, e)
+        finally:
+            try:
+                if hasattr(gen, "close"):
+                    gen.close()
+            finally:
+                loop.call_soon_threadsafe(pieces.put_nowait, done)
+
+    producer = asyncio.ensure_future(llm_lane.run(produce))
+    try:
+        while True:
+            item = await pieces.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        if producer.done():
+            producer.result()
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def sse_answer_stream(first_event: Dict[str, Any], prompt: str, max_tokens: int = 512, prefix: Optional[str] = None,
+                            on_done: Optional[Callable[[str, Optional[str]], None]] = None):
+    """
+    SSE body: `retrieval` (contexts/analysis), then one `token` event per generated piece,
+    then `done` with the full answer (or `error`). `on_done` receives the full answer and the
+    model id of the backend that produced it.
+    """
+    yield sse_event("retrieval", first_event)
+    parts: List[str] = []
+    served: Dict[str, Optional[str]] = {}
+    try:
+        async for piece in stream_llm_tokens(stream_llm_recorded, served, prompt, max_tokens=max_tokens, prefix=prefix):
+            parts.append(piece)
+            yield sse_event("token", {"text": piece})
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Mistral call failed: {e}"})
+        return
+    answer = "".join(parts)
+    if on_done is not None:
+        on_done(answer, served.get("model"))
+    yield sse_event("done", {"answer": answer})
+
+async def sse_cached_answer(first_event: Dict[str, Any], answer: str):
+    """Same event sequence as sse_answer_stream for an answer that is already known."""
+    yield sse_event("retrieval", first_event)
+    yield sse_event("token", {"text": answer})
+    yield sse_event("done", {"answer": answer})
+
+def sse_response(body) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # --------------------- Akave O3 (S3-compatible) or Mongo fallback ---------------------
 AKAVE_O3_ENDPOINT = os.environ.get("AKAVE_O3_ENDPOINT")
@@ -232,27 +1877,108 @@ AKAVE_O3_SECRET_ACCESS_KEY = os.environ.get("AKAVE_O3_SECRET_ACCESS_KEY")
 AKAVE_O3_REGION = os.environ.get("AKAVE_O3_REGION", "us-east-1")
 AKAVE_O3_BUCKET = os.environ.get("AKAVE_O3_BUCKET", "aikg")
 
+# MongoDB fallback
+MONGODB_URI = os.environ.get("MONGODB_URI")
+MONGODB_DB = os.environ.get("MONGODB_DB", "aikg")
+MONGODB_COLLECTION = os.environ.get("MONGODB_COLLECTION", "knowledge_graphs")
+
+# Connection pools shared by every request (boto3 clients and MongoClient are thread-safe)
+O3_MAX_POOL_CONNECTIONS = int(os.environ.get("O3_MAX_POOL_CONNECTIONS", str(max(10, IO_WORKERS))))
+MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", str(max(10, IO_WORKERS))))
+
 def has_o3_config() -> bool:
     return bool(AKAVE_O3_ENDPOINT and AKAVE_O3_ACCESS_KEY_ID and AKAVE_O3_SECRET_ACCESS_KEY)
 
+class StorageClients:
+    """
+    Process-wide O3 and MongoDB clients, created on first use. The bucket and the
+    collection validator are checked once per process instead of before every write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._o3 = None
+        self._mongo: Optional[MongoClient] = None
+        self._bucket_ready = False
+        self._collection_ready = False
+        self.o3_requests = 0
+        self.mongo_requests = 0
+
+    def o3(self):
+        if not has_o3_config():
+            raise RuntimeError("Akave O3 S3 config missing env vars")
+        with self._lock:
+            if self._o3 is None:
+                self._o3 = boto3.client(
+                    "s3",
+                    endpoint_url=AKAVE_O3_ENDPOINT,
+                    aws_access_key_id=AKAVE_O3_ACCESS_KEY_ID,
+                    aws_secret_access_key=AKAVE_O3_SECRET_ACCESS_KEY,
+                    config=Config(s3={"addressing_style": "path"}, max_pool_connections=O3_MAX_POOL_CONNECTIONS),
+                    region_name=AKAVE_O3_REGION,
+                )
+            self.o3_requests += 1
+            return self._o3
+
+    def mongo(self) -> MongoClient:
+        if not MONGODB_URI:
+            raise RuntimeError("MONGODB_URI not configured")
+        with self._lock:
+            if self._mongo is None:
+                self._mongo = MongoClient(MONGODB_URI, maxPoolSize=MONGODB_MAX_POOL_SIZE)
+            self.mongo_requests += 1
+            return self._mongo
+
+    def ensure_bucket(self):
+        if self._bucket_ready:
+            return
+        s3 = self.o3()
+        try:
+            s3.head_bucket(Bucket=AKAVE_O3_BUCKET)
+        except Exception:
+            s3.create_bucket(Bucket=AKAVE_O3_BUCKET)
+        self._bucket_ready = True
+
+    def ensure_collection(self):
+        db = self.mongo()[MONGODB_DB]
+        if not self._collection_ready:
+            _init_mongo_collection(db)
+            self._collection_ready = True
+        return db[MONGODB_COLLECTION]
+
+    def invalidate_bucket(self):
+        self._bucket_ready = False
+
+    def close(self):
+        with self._lock:
+            if self._mongo is not None:
+                self._mongo.close()
+                self._mongo = None
+            self._collection_ready = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "o3": {
+                "connected": self._o3 is not None,
+                "max_pool_connections": O3_MAX_POOL_CONNECTIONS,
+                "bucket_ready": self._bucket_ready,
+                "client_requests": self.o3_requests,
+            },
+            "mongo": {
+                "connected": self._mongo is not None,
+                "max_pool_size": MONGODB_MAX_POOL_SIZE,
+                "collection_ready": self._collection_ready,
+                "client_requests": self.mongo_requests,
+            },
+        }
+
+storage_clients = StorageClients()
+
 def get_o3_client():
-    if not has_o3_config():
-        raise RuntimeError("Akave O3 S3 config missing env vars")
-    return boto3.client(
-        "s3",
-        endpoint_url=AKAVE_O3_ENDPOINT,
-        aws_access_key_id=AKAVE_O3_ACCESS_KEY_ID,
-        aws_secret_access_key=AKAVE_O3_SECRET_ACCESS_KEY,
-        config=Config(s3={"addressing_style": "path"}),
-        region_name=AKAVE_O3_REGION,
-    )
+    return storage_clients.o3()
 
 def ensure_o3_bucket():
-    s3 = get_o3_client()
-    try:
-        s3.head_bucket(Bucket=AKAVE_O3_BUCKET)
-    except Exception:
-        s3.create_bucket(Bucket=AKAVE_O3_BUCKET)
+    storage_clients.ensure_bucket()
 
 def gen_kg_id(custom: Optional[str] = None) -> str:
     return custom if custom else uuid.uuid4().hex
@@ -261,27 +1987,23 @@ def store_kg_to_o3(kg_json: Dict[str, Any], kg_id: str, key_prefix: str = "kg/")
     ensure_o3_bucket()
     s3 = get_o3_client()
     key = f"{key_prefix}{kg_id}.json"
-    s3.put_object(
-        Bucket=AKAVE_O3_BUCKET,
-        Key=key,
-        Body=json.dumps(kg_json, ensure_ascii=False).encode("utf-8"),
-        ContentType="application/json",
-    )
+    body = json.dumps(kg_json, ensure_ascii=False).encode("utf-8")
+    try:
+        s3.put_object(Bucket=AKAVE_O3_BUCKET, Key=key, Body=body, ContentType="application/json")
+    except s3.exceptions.NoSuchBucket:
+        # Bucket removed since we checked it: re-create once and retry
+        storage_clients.invalidate_bucket()
+        ensure_o3_bucket()
+        s3.put_object(Bucket=AKAVE_O3_BUCKET, Key=key, Body=body, ContentType="application/json")
     return {"type": "o3", "bucket": AKAVE_O3_BUCKET, "key": key, "kg_id": kg_id}
 
-# MongoDB fallback
-MONGODB_URI = os.environ.get("MONGODB_URI")
-MONGODB_DB = os.environ.get("MONGODB_DB", "aikg")
-MONGODB_COLLECTION = os.environ.get("MONGODB_COLLECTION", "knowledge_graphs")
-
 def get_mongo_client() -> MongoClient:
-    if not MONGODB_URI:
-        raise RuntimeError("MONGODB_URI not configured")
-    return MongoClient(MONGODB_URI)
+    return storage_clients.mongo()
 
 def ensure_mongo_collection():
-    client = get_mongo_client()
-    db = client[MONGODB_DB]
+    return storage_clients.ensure_collection()
+
+def _init_mongo_collection(db):
     validator = {
         "$jsonSchema": {
             "bsonType": "object",
@@ -300,7 +2022,6 @@ def ensure_mongo_collection():
             db.command({"collMod": MONGODB_COLLECTION, "validator": validator})
         except Exception:
             pass
-    return db[MONGODB_COLLECTION]
 
 def store_kg_to_mongo(kg_json: Dict[str, Any], kg_id: Optional[str] = None) -> Dict[str, str]:
     coll = ensure_mongo_collection()
@@ -328,25 +2049,113 @@ def fetch_kg_from_mongo(collection: str, id_str: str) -> Dict[str, Any]:
 # --------------------- Lighthouse (embeddings storage) - SDK ONLY ---------------------
 LIGHTHOUSE_TOKEN = os.environ.get("LIGHTHOUSE_TOKEN")
 
+# CID payloads are immutable so they can be cached forever
+CID_CACHE_ENABLED = os.environ.get("CID_CACHE_ENABLED", "1") == "1"
+CID_CACHE_DIR = os.environ.get("CID_CACHE_DIR", os.path.join(OMNIMIND_STATE_DIR, "cid_cache"))
+CID_CACHE_MAX_BYTES = int(os.environ.get("CID_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+CID_CACHE_OPEN_ENTRIES = int(os.environ.get("CID_CACHE_OPEN_ENTRIES", "64"))
+
+# Embedding payload container written to Lighthouse ("binary" or legacy "json")
+EMBEDDINGS_PAYLOAD_FORMAT = os.environ.get("EMBEDDINGS_PAYLOAD_FORMAT", "binary")
+EMBEDDINGS_PAYLOAD_DTYPE = os.environ.get("EMBEDDINGS_PAYLOAD_DTYPE", "float32")  # float32 | float16
+
+# Binary layout (all integers little-endian):
+#   magic "OMNIEMB\0" | u16 version | u32 header_len | header JSON (model, dim, count, dtype, ...)
+#   | padding to 16 bytes | count x dim matrix in `dtype` | count x (u32 byte length + UTF-8 text)
+#   | optional IVF index when header["ann"] is set: nlist x dim <f4 centroids, (nlist+1) <i8 offsets, count <i8 ids
+EMB_PAYLOAD_MAGIC = b"OMNIEMB\x00"
+EMB_PAYLOAD_VERSION = 1
+_EMB_PAYLOAD_PREFIX = struct.Struct("<8sHI")
+_EMB_PAYLOAD_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+def encode_embeddings_payload(payload: Dict[str, Any], dtype: str = EMBEDDINGS_PAYLOAD_DTYPE) -> bytes:
+    if dtype not in _EMB_PAYLOAD_DTYPES:
+        raise ValueError(f"Unsupported embeddings dtype {dtype}")
+    texts = payload["texts"]
+    matrix = np.ascontiguousarray(payload["embeddings"], dtype=_EMB_PAYLOAD_DTYPES[dtype])
+    if matrix.ndim != 2 or matrix.shape[0] != len(texts):
+        raise ValueError("embeddings must be a count x dim matrix matching texts")
+    index: Optional[IVFIndex] = payload.get("ann_index")
+    header = {k: v for k, v in payload.items() if k not in ("texts", "embeddings", "ann_index", "norms")}
+    header.update({"dim": int(matrix.shape[1]), "count": int(matrix.shape[0]), "dtype": dtype})
+    if index is not None:
+        header["ann"] = {"type": "ivf", "nlist": index.nlist}
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    # Pad the header so the matrix starts on a 16-byte boundary
+    header_bytes += b" " * (-(_EMB_PAYLOAD_PREFIX.size + len(header_bytes)) % 16)
+    parts = [_EMB_PAYLOAD_PREFIX.pack(EMB_PAYLOAD_MAGIC, EMB_PAYLOAD_VERSION, len(header_bytes)), header_bytes, matrix.tobytes()]
+    for text in texts:
+        data = text.encode("utf-8")
+        parts.append(struct.pack("<I", len(data)))
+        parts.append(data)
+    if index is not None:
+        parts.append(index.centroids.astype("<f4").tobytes())
+        parts.append(index.list_offsets.astype("<i8").tobytes())
+        parts.append(index.list_ids.astype("<i8").tobytes())
+    return b"".join(parts)
+
+def decode_embeddings_payload(data: bytes) -> Dict[str, Any]:
+    """Decode a Lighthouse embeddings payload; binary containers and legacy JSON are both accepted."""
+    if not data.startswith(EMB_PAYLOAD_MAGIC):
+        return json.loads(data.decode("utf-8"))
+    _, version, header_len = _EMB_PAYLOAD_PREFIX.unpack_from(data, 0)
+    if version != EMB_PAYLOAD_VERSION:
+        raise ValueError(f"Unsupported embeddings payload version {version}")
+    offset = _EMB_PAYLOAD_PREFIX.size
+    header = json.loads(data[offset:offset + header_len].decode("utf-8"))
+    offset += header_len
+    count, dim = header["count"], header["dim"]
+    np_dtype = np.dtype(_EMB_PAYLOAD_DTYPES[header["dtype"]])
+    matrix = np.frombuffer(data, dtype=np_dtype, count=count * dim, offset=offset).reshape(count, dim)
+    offset += matrix.nbytes
+    texts = []
+    for _ in range(count):
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        texts.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    result = dict(header, texts=texts, embeddings=matrix.astype(np.float32))
+    ann = result.pop("ann", None)
+    if ann and ann.get("type") == "ivf":
+        nlist = ann["nlist"]
+        centroids = np.frombuffer(data, dtype="<f4", count=nlist * dim, offset=offset).reshape(nlist, dim)
+        offset += centroids.nbytes
+        list_offsets = np.frombuffer(data, dtype="<i8", count=nlist + 1, offset=offset)
+        offset += list_offsets.nbytes
+        list_ids = np.frombuffer(data, dtype="<i8", count=count, offset=offset)
+        result["ann_index"] = IVFIndex(centroids, list_offsets, list_ids)
+    return result
+
+def serialize_embeddings_payload(payload: Dict[str, Any]) -> Tuple[bytes, str]:
+    if EMBEDDINGS_PAYLOAD_FORMAT == "json":
+        # Legacy JSON has no ANN section; the index is rebuilt on first query instead
+        doc = {k: v for k, v in payload.items() if k not in ("ann_index", "norms")}
+        doc["embeddings"] = np.asarray(payload["embeddings"], dtype=np.float32).tolist()
+        return json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), ".json"
+    return encode_embeddings_payload(payload), ".omniemb"
+
 def store_embeddings_to_lighthouse(payload: Dict[str, Any]) -> str:
     if Lighthouse is None:
         raise RuntimeError("lighthouseweb3 not installed")
     if not LIGHTHOUSE_TOKEN:
         raise RuntimeError("LIGHTHOUSE_TOKEN not configured")
     
-    # Fix: Open temp file in text mode
-    with tempfile.NamedTemporaryFile(mode='w+t', delete=False, suffix=".json", encoding='utf-8') as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
-        temp_path = f.name
-    
-    try:
-        lh = Lighthouse(token=LIGHTHOUSE_TOKEN)
-        resp = lh.upload(temp_path)
-    finally:
+    data, suffix = serialize_embeddings_payload(payload)
+    lh = Lighthouse(token=LIGHTHOUSE_TOKEN)
+    if hasattr(lh, "uploadBlob"):
+        resp = lh.uploadBlob(io.BytesIO(data), f"embeddings-{uuid.uuid4().hex}{suffix}")
+    else:
+        # Older SDKs only upload from a path
+        with tempfile.NamedTemporaryFile(mode="wb", delete=False, suffix=suffix) as f:
+            f.write(data)
+            temp_path = f.name
         try:
-            os.unlink(temp_path)
-        except Exception:
-            pass
+            resp = lh.upload(temp_path)
+        finally:
+            try:
+                os.unlink(temp_path)
+            except Exception:
+                pass
     
     cid = None
     if isinstance(resp, dict):
@@ -356,6 +2165,7 @@ def store_embeddings_to_lighthouse(payload: Dict[str, Any]) -> str:
     return cid
 
 def fetch_json_from_lighthouse_cid(cid: str) -> Dict[str, Any]:
+    """Download and decode an embeddings payload (binary container or legacy JSON)."""
     if not LIGHTHOUSE_TOKEN:
         raise RuntimeError("LIGHTHOUSE_TOKEN not configured")
     
@@ -372,15 +2182,248 @@ def fetch_json_from_lighthouse_cid(cid: str) -> Dict[str, Any]:
         else:
             content = file_content
         
-        # Convert to string if it's bytes
-        if isinstance(content, bytes):
-            content = content.decode('utf-8')
+        if isinstance(content, str):
+            content = content.encode("utf-8")
         
-        # Parse JSON
-        return json.loads(content)
+        return decode_embeddings_payload(content)
     except Exception as e:
         raise RuntimeError(f"Failed to download from Lighthouse CID {cid}: {e}")
 
+# --------------------- Local CID cache (memory-mapped embeddings) ---------------------
+class CidCache:
+    """
+    On-disk cache of Lighthouse embedding payloads, one directory per CID:
+      meta.json (model/dim/count/...), texts.json, embeddings.npy (float32, opened with mmap).
+    Entries are written to a temp dir and renamed into place, so several workers can share
+    the cache directory and the page cache. Least-recently-used entries are deleted once
+    the directory exceeds `max_bytes`. Row norms (norms.npy) and an optional IVF index
+    (ann_*.npy) are kept alongside the matrix.
+    """
+
+    # Directory mtime is the LRU clock shared by all workers; in-memory hits refresh it at most this often
+    TOUCH_INTERVAL_S = 30.0
+
+    def __init__(self, root: str, max_bytes: int, open_entries: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.open_entries = open_entries
+        self._open: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry_dir(self, cid: str) -> str:
+        if not re.fullmatch(r"[A-Za-z0-9]+", cid):
+            raise ValueError(f"Refusing to cache unexpected CID {cid!r}")
+        return os.path.join(self.root, cid)
+
+    def get(self, cid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._open.get(cid)
+            if entry is not None:
+                self._open.move_to_end(cid)
+                self.hits += 1
+                touch = time.time() - self._touched.get(cid, 0.0) >= self.TOUCH_INTERVAL_S
+        if entry is not None:
+            if touch:
+                self._touch(cid)
+            return entry
+        entry_dir = self._entry_dir(cid)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(entry_dir, "texts.json"), "r", encoding="utf-8") as f:
+                texts = json.load(f)
+            embeddings = np.load(os.path.join(entry_dir, "embeddings.npy"), mmap_mode="r")
+            norms = np.load(os.path.join(entry_dir, "norms.npy"))
+            ann_index = None
+            if os.path.exists(os.path.join(entry_dir, "ann_ids.npy")):
+                ann_index = IVFIndex(
+                    np.load(os.path.join(entry_dir, "ann_centroids.npy")),
+                    np.load(os.path.join(entry_dir, "ann_offsets.npy")),
+                    np.load(os.path.join(entry_dir, "ann_ids.npy"), mmap_mode="r"),
+                )
+            self._touch(cid)
+        except Exception as e:
+            print(f"CID cache entry {cid} unreadable, dropping it: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            with self._lock:
+                self.misses += 1
+            return None
+        entry = dict(meta, texts=texts, embeddings=embeddings, norms=norms, ann_index=ann_index)
+        with self._lock:
+            self.hits += 1
+            self._open[cid] = entry
+            while len(self._open) > self.open_entries:
+                closed, _ = self._open.popitem(last=False)
+                self._touched.pop(closed, None)
+        return entry
+
+    def _touch(self, cid: str):
+        """Advance the entry's LRU clock (directory mtime) for eviction."""
+        try:
+            os.utime(self._entry_dir(cid))
+        except OSError:
+            return  # evicted meanwhile (possibly by another worker)
+        with self._lock:
+            self._touched[cid] = time.time()
+
+    def put(self, cid: str, payload: Dict[str, Any]):
+        entry_dir = self._entry_dir(cid)
+        if os.path.exists(entry_dir):
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f".tmp-{cid}-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            matrix = np.ascontiguousarray(payload["embeddings"], dtype=np.float32)
+            np.save(os.path.join(tmp_dir, "embeddings.npy"), matrix)
+            np.save(os.path.join(tmp_dir, "norms.npy"), row_norms(matrix))
+            if payload.get("ann_index") is not None:
+                self._save_ann(tmp_dir, payload["ann_index"])
+            with open(os.path.join(tmp_dir, "texts.json"), "w", encoding="utf-8") as f:
+                json.dump(payload["texts"], f, ensure_ascii=False)
+            meta = {k: v for k, v in payload.items() if k not in ("texts", "embeddings", "ann_index", "norms")}
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another worker cached the same CID first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.exists(entry_dir):
+                raise
+        self._evict()
+
+    @staticmethod
+    def _save_ann(entry_dir: str, index: IVFIndex):
+        np.save(os.path.join(entry_dir, "ann_centroids.npy"), index.centroids)
+        np.save(os.path.join(entry_dir, "ann_offsets.npy"), index.list_offsets)
+        # ids last: their presence marks a complete index
+        tmp_ids = os.path.join(entry_dir, f".ann_ids-{uuid.uuid4().hex}.npy")
+        np.save(tmp_ids, index.list_ids)
+        os.replace(tmp_ids, os.path.join(entry_dir, "ann_ids.npy"))
+
+    def attach_ann(self, cid: str, index: IVFIndex):
+        """Persist an index built after the payload was cached (legacy JSON payloads)."""
+        entry_dir = self._entry_dir(cid)
+        if os.path.isdir(entry_dir):
+            self._save_ann(entry_dir, index)
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            if name.startswith(".tmp-"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, name))
+            except OSError:
+                continue
+            total += size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            with self._lock:
+                self._open.pop(name, None)
+                self._touched.pop(name, None)
+                self.evictions += 1
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": CID_CACHE_ENABLED,
+            "dir": self.root,
+            "max_bytes": self.max_bytes,
+            "open_entries": len(self._open),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+cid_cache = CidCache(CID_CACHE_DIR, CID_CACHE_MAX_BYTES, CID_CACHE_OPEN_ENTRIES)
+
+def fetch_embeddings_by_cid(cid: str) -> Dict[str, Any]:
+    """
+    Embedding payload for `cid` with `embeddings` as a float32 matrix (memory-mapped
+    when served from the local cache). Downloads from Lighthouse only on a cache miss.
+    """
+    if CID_CACHE_ENABLED:
+        entry = cid_cache.get(cid)
+        if entry is not None:
+            return entry
+    payload = fetch_json_from_lighthouse_cid(cid)
+    texts = payload.get("texts", [])
+    embeddings = payload.get("embeddings", [])
+    if not texts or len(embeddings) == 0 or len(texts) != len(embeddings):
+        raise RuntimeError("Invalid embedding payload from Lighthouse")
+    if CID_CACHE_ENABLED:
+        try:
+            cid_cache.put(cid, payload)
+            entry = cid_cache.get(cid)
+            if entry is not None:
+                return entry
+        except Exception as e:
+            print(f"CID cache write failed for {cid}: {e}")
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    return dict(payload, embeddings=matrix, norms=row_norms(matrix))
+
+# One lock per CID: concurrent queries on a corpus share its build, other corpora don't wait on it
+_ann_build_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_ann_build_locks_guard = threading.Lock()
+
+def ensure_ann_index(cid: str, entry: Dict[str, Any]) -> IVFIndex:
+    """IVF index for a cached payload, building (and persisting) it on first use."""
+    index = entry.get("ann_index")
+    if index is not None:
+        return index
+    with _ann_build_locks_guard:
+        lock = _ann_build_locks[cid]
+    with lock:
+        index = entry.get("ann_index")
+        if index is None:
+            started = time.time()
+            index = IVFIndex.build(entry["embeddings"])
+            print(f"Built IVF index for {cid}: {len(entry['embeddings'])} rows, nlist={index.nlist} in {time.time() - started:.1f}s")
+            entry["ann_index"] = index
+            if CID_CACHE_ENABLED:
+                try:
+                    cid_cache.attach_ann(cid, index)
+                except Exception as e:
+                    print(f"Could not persist IVF index for {cid}: {e}")
+        return index
+
+def search_corpus(cid: str, entry: Dict[str, Any], query: np.ndarray, top_k: int,
+                  exact: bool = False, nprobe: Optional[int] = None) -> Tuple[np.ndarray, List[float], Dict[str, Any]]:
+    """Top-k rows of a fetched payload: IVF for large corpora, exact cosine otherwise."""
+    embeddings = entry["embeddings"]
+    q = normalize_rows(query)[0]
+    if not exact and len(embeddings) >= ANN_MIN_ROWS:
+        index = ensure_ann_index(cid, entry)
+        probes = nprobe or ANN_NPROBE
+        ids, scores = index.search(embeddings, entry["norms"], q, top_k, probes)
+        return ids, [float(x) for x in scores], {"method": "ivf", "nlist": index.nlist, "nprobe": min(probes, index.nlist)}
+    ids, scores = top_k_cosine(embeddings, q, top_k, norms=entry["norms"])
+    return ids, [float(x) for x in scores], {"method": "exact"}
+
+def fetch_embeddings_json_by_cid(cid: str) -> Dict[str, Any]:
+    """Same payload as fetch_embeddings_by_cid with embeddings as nested lists, for JSON responses."""
+    entry = fetch_embeddings_by_cid(cid)
+    doc = {k: v for k, v in entry.items() if k not in ("norms", "ann_index")}
+    return dict(doc, embeddings=np.asarray(entry["embeddings"]).tolist())
+
 # --------------------- data_id helpers ---------------------
 def build_data_id(embedding_cid: str, loc: Dict[str, str]) -> str:
     """
@@ -413,68 +2456,230 @@ def parse_data_id(data_id: str) -> Tuple[str, str, str, str]:
     p1, p2 = path.split("/", 1)
     return cid, scheme, p1, p2
 
+def fetch_kg_by_location(scheme: str, p1: str, p2: str) -> Dict[str, Any]:
+    if scheme == "o3":
+        bucket, key = p1, p2
+        s3 = get_o3_client()
+        obj = s3.get_object(Bucket=bucket, Key=key)
+        return json.loads(obj["Body"].read())
+    if scheme == "mongo":
+        collection, kg_id = p1, p2
+        return fetch_kg_from_mongo(collection, kg_id)
+    raise RuntimeError("Unknown KG scheme")
+
+def store_kg(kg_json: Dict[str, Any], kg_id: str, key_prefix: str, custom_kg_id: Optional[str]) -> Dict[str, str]:
+    # O3 if available, otherwise MongoDB (_id will be the kg_id returned)
+    if has_o3_config():
+        return store_kg_to_o3(kg_json=kg_json, kg_id=kg_id, key_prefix=key_prefix)
+    return store_kg_to_mongo(kg_json=kg_json, kg_id=custom_kg_id)
+
+# --------------------- Storage fan-out (KG store ∥ Lighthouse) ---------------------
+STORAGE_KG_TIMEOUT_S = float(os.environ.get("STORAGE_KG_TIMEOUT_S", "30"))
+STORAGE_EMBEDDINGS_TIMEOUT_S = float(os.environ.get("STORAGE_EMBEDDINGS_TIMEOUT_S", "120"))
+
+async def storage_fanout(calls: Dict[str, Tuple[float, Callable, tuple]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Run independent storage calls {name: (timeout_s, fn, args)} concurrently on the I/O lane.
+    Never raises: each result is {"ok", "value" | "error", "elapsed_ms"}. A timed-out call is
+    abandoned (its thread finishes in the background) and reported as failed.
+    """
+    async def one(timeout: float, fn: Callable, args: tuple) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(io_lane.run(fn, *args), timeout)
+            result = {"ok": True, "value": value}
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"timed out after {timeout:g}s"}
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    results = await asyncio.gather(*(one(*call) for call in calls.values()))
+    return dict(zip(calls, results))
+
+def storage_report(results: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Fan-out results without the payloads, for error details and diagnostics."""
+    return {name: {k: v for k, v in r.items() if k != "value"} for name, r in results.items()}
+
+async def fetch_corpus_and_kg(cid: str, scheme: str, p1: str, p2: str, fetch_embeddings: Callable = None) -> Dict[str, Dict[str, Any]]:
+    """Concurrent reads for a data_id: embeddings payload from Lighthouse and the KG from O3/Mongo."""
+    return await storage_fanout({
+        "embeddings": (STORAGE_EMBEDDINGS_TIMEOUT_S, fetch_embeddings or fetch_embeddings_by_cid, (cid,)),
+        "kg": (STORAGE_KG_TIMEOUT_S, fetch_kg_by_location, (scheme, p1, p2)),
+    })
+
 # --------------------- Improved Knowledge Graph Generation ---------------------
-def generate_kg_from_texts(chunks: List[str], source_type: str = "text") -> Dict[str, Any]:
-    joined = "\n\n".join(chunks[:1500])  # Limit input size
-    
-    # STRICT JSON schema prompt
-    sys = (
-        "You are a JSON knowledge graph generator. Output ONLY valid JSON matching this EXACT schema:\n"
-        "{\n"
-        '  "nodes": [{"id": "node1", "type": "concept", "label": "example"}],\n'
-        '  "edges": [{"source": "node1", "target": "node2", "relation": "relates_to", "evidence": "quote"}]\n'
-        "}\n"
-        "RULES:\n"
-        "- Output ONLY the JSON object, no other text\n"
-        "- Always include at least 2 nodes and 1 edge\n" 
-        "- Use simple node IDs like 'node1', 'node2', etc\n"
-        "- Keep labels under 50 characters\n"
-        "- Extract actual concepts from the text"
-    )
-    
-    prompt = f"[SYSTEM]\n{sys}\n\n[USER]\nText:\n{joined}\n\nJSON:"
-    
+# STRICT JSON schema prompt
+KG_SYSTEM_PROMPT = (
+    "You are a JSON knowledge graph generator. Output ONLY valid JSON matching this EXACT schema:\n"
+    "{\n"
+    '  "nodes": [{"id": "node1", "type": "concept", "label": "example"}],\n'
+    '  "edges": [{"source": "node1", "target": "node2", "relation": "relates_to", "evidence": "quote"}]\n'
+    "}\n"
+    "RULES:\n"
+    "- Output ONLY the JSON object, no other text\n"
+    "- Always include at least 2 nodes and 1 edge\n" 
+    "- Use simple node IDs like 'node1', 'node2', etc\n"
+    "- Keep labels under 50 characters\n"
+    "- Extract actual concepts from the text"
+)
+KG_PROMPT_PREFIX = register_prompt_prefix("kg", f"[SYSTEM]\n{KG_SYSTEM_PROMPT}\n\n[USER]\nText:\n")
+
+def parse_kg_json(raw: str) -> Optional[Dict[str, Any]]:
+    """Return the first balanced {...} block in the model output that looks like a KG."""
+    # More aggressive JSON extraction
+    txt = raw.strip()
+
+    # Find JSON boundaries more reliably
+    start_idx = -1
+    brace_count = 0
+    for i, char in enumerate(txt):
+        if char == '{':
+            if start_idx == -1:
+                start_idx = i
+            brace_count += 1
+        elif char == '}':
+            brace_count -= 1
+            if brace_count == 0 and start_idx != -1:
+                json_str = txt[start_idx:i+1]
+                start_idx = -1
+                try:
+                    kg = json.loads(json_str)
+                except json.JSONDecodeError:
+                    continue
+                # Validate structure; must have at least some nodes
+                if isinstance(kg, dict) and isinstance(kg.get("nodes"), list) and isinstance(kg.get("edges"), list) and kg["nodes"]:
+                    return kg
+    return None
+
+def extract_kg_window(text: str) -> Optional[Dict[str, Any]]:
+    """Map step: one Mistral call over one context-sized window."""
+    prompt = f"{KG_PROMPT_PREFIX}{text}\n\nJSON:"
     try:
         # Use the max token version for better output
-        raw = run_mistral_max(prompt, max_tokens=800)
-        
-        # More aggressive JSON extraction
-        txt = raw.strip()
-        
-        # Find JSON boundaries more reliably
-        start_idx = -1
-        brace_count = 0
-        for i, char in enumerate(txt):
-            if char == '{':
-                if start_idx == -1:
-                    start_idx = i
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-                if brace_count == 0 and start_idx != -1:
-                    json_str = txt[start_idx:i+1]
-                    try:
-                        kg = json.loads(json_str)
-                        # Validate structure
-                        if isinstance(kg.get("nodes"), list) and isinstance(kg.get("edges"), list):
-                            if len(kg["nodes"]) > 0:  # Must have at least some nodes
-                                kg["metadata"] = {
-                                    "schema": "aikg-v1",
-                                    "created_at": int(time.time() * 1000),
-                                    "source": source_type,
-                                    "method": "mistral"
-                                }
-                                print(f"✅ KG Success: {len(kg['nodes'])} nodes, {len(kg['edges'])} edges")
-                                return kg
-                    except json.JSONDecodeError:
-                        continue
-        
-        # If we get here, JSON parsing failed
-        print(f"❌ Mistral JSON failed. Raw output: {raw[:200]}...")
-        
+        raw = run_mistral_max(prompt, max_tokens=KG_MAX_TOKENS, prefix="kg")
     except Exception as e:
         print(f"❌ Mistral error: {e}")
-    
+        return None
+    kg = parse_kg_json(raw)
+    if kg is None:
+        print(f"❌ Mistral JSON failed. Raw output: {raw[:200]}...")
+    return kg
+
+def kg_windows(chunks: List[str], window_chars: int = None, max_windows: int = None) -> List[str]:
+    """
+    Pack chunks greedily into windows of at most `window_chars` characters (long chunks are split).
+    If there are more than `max_windows`, keep an evenly spaced subset so the KG still spans the
+    whole corpus rather than only its beginning.
+    """
+    window_chars = max(256, window_chars or KG_WINDOW_CHARS)
+    max_windows = KG_MAX_WINDOWS if max_windows is None else max_windows
+    windows: List[str] = []
+    current: List[str] = []
+    size = 0
+    for chunk in chunks:
+        chunk = chunk.strip()
+        pieces = [chunk[i:i + window_chars] for i in range(0, len(chunk), window_chars)]
+        for piece in pieces:
+            if current and size + len(piece) + 2 > window_chars:
+                windows.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+    if current:
+        windows.append("\n\n".join(current))
+    if max_windows and len(windows) > max_windows:
+        picks = np.linspace(0, len(windows) - 1, max_windows).round().astype(int)
+        windows = [windows[i] for i in sorted(set(picks.tolist()))]
+    return windows
+
+def normalize_kg_label(label: Any) -> str:
+    text = unicodedata.normalize("NFKC", str(label or "")).casefold()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t.,;:!?\"'()[]{}")
+
+def kg_node_id(normalized_label: str) -> str:
+    # Stable across windows, documents and re-ingestion of the same concept
+    return "n_" + hashlib.sha1(normalized_label.encode("utf-8")).hexdigest()[:10]
+
+def merge_kgs(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reduce step: union of per-window KGs with nodes keyed by normalized label and edges de-duplicated."""
+    nodes: Dict[str, Dict[str, Any]] = {}
+    edges: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for kg in partials:
+        local_ids: Dict[str, str] = {}
+        for node in kg.get("nodes", []):
+            if not isinstance(node, dict):
+                continue
+            norm = normalize_kg_label(node.get("label") or node.get("id"))
+            if not norm:
+                continue
+            nid = kg_node_id(norm)
+            local_ids[str(node.get("id", norm))] = nid
+            if nid in nodes:
+                nodes[nid]["mentions"] += 1
+            else:
+                nodes[nid] = {
+                    "id": nid,
+                    "type": node.get("type") or "concept",
+                    "label": str(node.get("label") or node.get("id"))[:50],
+                    "mentions": 1,
+                }
+        for edge in kg.get("edges", []):
+            if not isinstance(edge, dict):
+                continue
+            src = local_ids.get(str(edge.get("source")))
+            dst = local_ids.get(str(edge.get("target")))
+            if not src or not dst:
+                continue
+            relation = normalize_kg_label(edge.get("relation")) or "related_to"
+            key = (src, dst, relation)
+            if key not in edges:
+                edges[key] = {"source": src, "target": dst, "relation": relation, "evidence": edge.get("evidence", "")}
+    return {"nodes": list(nodes.values()), "edges": list(edges.values())}
+
+_kg_window_slots = asyncio.Semaphore(KG_MAX_CONCURRENT_WINDOWS)
+# Each llama-cli fallback run uses all MISTRAL_THREADS cores, so those run one at a time
+_kg_cli_slot = asyncio.Semaphore(1)
+
+async def extract_kg_window_bounded(text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(window KG, model id of the backend that produced it)"""
+    async with _kg_window_slots:
+        if OLLAMA_HTTP_URL or llama_pool.available():
+            return await llm_lane.run(run_llm_recorded, extract_kg_window, text)
+        async with _kg_cli_slot:
+            return await llm_lane.run(run_llm_recorded, extract_kg_window, text)
+
+async def generate_kg_from_texts(chunks: List[str], source_type: str = "text") -> Dict[str, Any]:
+    """
+    Map-reduce KG extraction: windows are extracted concurrently on the LLM lane (at most
+    KG_MAX_CONCURRENT_WINDOWS at a time across builds), then merged. Falls back to keyword
+    extraction if no window yields JSON.
+    """
+    windows = kg_windows(chunks)
+    results = await asyncio.gather(*(extract_kg_window_bounded(w) for w in windows))
+    partials = [kg for kg, _ in results if kg]
+    models = sorted({model for kg, model in results if kg and model})
+    if partials:
+        kg = merge_kgs(partials)
+        if kg["nodes"]:
+            kg["metadata"] = {
+                "schema": "aikg-v1",
+                "created_at": int(time.time() * 1000),
+                "source": source_type,
+                "method": "mistral",
+                "windows": len(windows),
+                "windows_ok": len(partials),
+                "models": models,
+            }
+            print(f"✅ KG Success: {len(kg['nodes'])} nodes, {len(kg['edges'])} edges from {len(partials)}/{len(windows)} windows")
+            return kg
+    return fallback_kg_from_texts(chunks, source_type)
+
+def fallback_kg_from_texts(chunks: List[str], source_type: str = "text") -> Dict[str, Any]:
+    joined = "\n\n".join(chunks[:1500])
+
     # RELIABLE FALLBACK - Always generates valid KG
     print("🔄 Using reliable fallback KG generator")
     
@@ -533,6 +2738,321 @@ def generate_kg_from_texts(chunks: List[str], source_type: str = "text") -> Dict
     print(f"✅ Fallback KG: {len(fallback_kg['nodes'])} nodes, {len(fallback_kg['edges'])} edges")
     return fallback_kg
 
+# --------------------- Persistent KG cache ---------------------
+# Bump when the extraction prompt/merge logic changes so stale graphs are not reused
+KG_PROMPT_VERSION = "kg-mapreduce-1"
+KG_CACHE_ENABLED = os.environ.get("KG_CACHE_ENABLED", "1") == "1"
+KG_CACHE_PATH = os.environ.get("KG_CACHE_PATH", os.path.join(OMNIMIND_STATE_DIR, "kg_cache.sqlite3"))
+KG_CACHE_MAX_ENTRIES = int(os.environ.get("KG_CACHE_MAX_ENTRIES", "10000"))
+
+def kg_model_id() -> str:
+    """Model id of the preferred generation backend; cached results are filed under it only if it served them."""
+    return llm_model_id("ollama" if OLLAMA_HTTP_URL else "llama.cpp")
+
+class KGCache:
+    """
+    SQLite-backed cache of generated KGs keyed by SHA-256 of
+    (prompt version, system prompt, model, source_type, normalized texts).
+    Survives restarts and is shared by workers pointing at the same state dir.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kg_cache ("
+                "key TEXT PRIMARY KEY, kg TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS kg_cache_last_used ON kg_cache(last_used)")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def get_key(texts: List[str], source_type: str, model: str) -> str:
+        normalized = [re.sub(r"\s+", " ", unicodedata.normalize("NFKC", t)).strip() for t in texts]
+        h = hashlib.sha256()
+        h.update(json.dumps([KG_PROMPT_VERSION, KG_SYSTEM_PROMPT, model, source_type], ensure_ascii=False).encode("utf-8"))
+        for text in normalized:
+            h.update(b"\x00")
+            h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT kg FROM kg_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE kg_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, kg: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO kg_cache (key, kg, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(kg, ensure_ascii=False), now, now),
+            )
+            (count,) = db.execute("SELECT COUNT(*) FROM kg_cache").fetchone()
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                db.execute(
+                    "DELETE FROM kg_cache WHERE key IN (SELECT key FROM kg_cache ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": KG_CACHE_ENABLED,
+            "path": self.path,
+            "max_entries": self.max_entries,
+            "prompt_version": KG_PROMPT_VERSION,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+kg_cache = KGCache(KG_CACHE_PATH, KG_CACHE_MAX_ENTRIES)
+
+# --------------------- Persistent image analysis cache ---------------------
+IMAGE_CACHE_ENABLED = os.environ.get("IMAGE_CACHE_ENABLED", "1") == "1"
+IMAGE_CACHE_PATH = os.environ.get("IMAGE_CACHE_PATH", os.path.join(OMNIMIND_STATE_DIR, "image_cache.sqlite3"))
+IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get("IMAGE_CACHE_MAX_ENTRIES", "50000"))
+# 0 = exact bytes only; >0 also reuses analyses of images whose dHash differs in at most this many bits
+IMAGE_CACHE_DHASH_MAX_DISTANCE = int(os.environ.get("IMAGE_CACHE_DHASH_MAX_DISTANCE", "0"))
+
+def image_analysis_backend(by_pixtral: bool) -> str:
+    if by_pixtral:
+        return f"pixtral:{PIXTRAL_HTTP_URL}"
+    return f"blip:{os.environ.get('BLIP_MODEL', 'Salesforce/blip-image-captioning-large')}"
+
+def image_analysis_prompt(by_pixtral: bool, system_prompt: str, user_prompt: str) -> str:
+    # BLIP captions unconditionally, so prompts must not split its cache entries
+    if not by_pixtral:
+        return ""
+    return hashlib.sha256(json.dumps([system_prompt, user_prompt]).encode("utf-8")).hexdigest()
+
+class ImageAnalysisCache:
+    """
+    SQLite-backed map (SHA-256 of the image bytes, captioning backend, prompt) -> analysis,
+    plus the description embedding per embedding model. Lookups fall back to the nearest
+    dHash within IMAGE_CACHE_DHASH_MAX_DISTANCE bits for re-encoded / resized copies.
+    """
+
+    def __init__(self, path: str, max_entries: int, dhash_max_distance: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.dhash_max_distance = dhash_max_distance
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.embedding_hits = 0
+        self.derived_hits = 0
+        self.derived_misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_analysis ("
+                "key TEXT PRIMARY KEY, backend TEXT NOT NULL, prompt TEXT NOT NULL, dhash INTEGER NOT NULL, "
+                "analysis TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS image_analysis_scope ON image_analysis(backend, prompt)")
+            conn.execute("CREATE INDEX IF NOT EXISTS image_analysis_last_used ON image_analysis(last_used)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_embedding ("
+                "key TEXT NOT NULL, model TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (key, model))"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def get_key(sha256: str, backend: str, prompt: str) -> str:
+        return hashlib.sha256(f"{sha256}|{backend}|{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _to_sql_int(value: int) -> int:
+        # SQLite integers are signed 64-bit
+        return value - (1 << 64) if value >= (1 << 63) else value
+
+    def _nearest(self, db: sqlite3.Connection, backend: str, prompt: str, dhash: int) -> Optional[str]:
+        rows = db.execute("SELECT key, dhash FROM image_analysis WHERE backend = ? AND prompt = ?", (backend, prompt)).fetchall()
+        if not rows:
+            return None
+        hashes = np.array([h for _, h in rows], dtype=np.int64).view(np.uint64)
+        diff = np.bitwise_xor(hashes, np.uint64(dhash))
+        distances = np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        best = int(np.argmin(distances))
+        return rows[best][0] if distances[best] <= self.dhash_max_distance else None
+
+    def lookup(self, image: PreparedImage, backend: str, prompt: str) -> Optional[Dict[str, Any]]:
+        key = self.get_key(image.sha256(), backend, prompt)
+        image.analysis_key = key
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT analysis FROM image_analysis WHERE key = ?", (key,)).fetchone()
+            if row is None and self.dhash_max_distance > 0:
+                near_key = self._nearest(db, backend, prompt, image.dhash())
+                if near_key is not None:
+                    row = db.execute("SELECT analysis FROM image_analysis WHERE key = ?", (near_key,)).fetchone()
+                    key = image.analysis_key = near_key
+                    self.near_hits += 1
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            db.execute("UPDATE image_analysis SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+        return json.loads(row[0])
+
+    def store(self, image: PreparedImage, backend: str, prompt: str, analysis: Dict[str, Any]):
+        key = self.get_key(image.sha256(), backend, prompt)
+        image.analysis_key = key
+        dhash = self._to_sql_int(image.dhash())
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO image_analysis (key, backend, prompt, dhash, analysis, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, backend, prompt, dhash, json.dumps(analysis, ensure_ascii=False), now, now),
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        """Drop least-recently-used rows beyond max_entries, with the embeddings and derived rows of evicted analyses."""
+        (count,) = db.execute("SELECT COUNT(*) FROM image_analysis").fetchone()
+        if count <= self.max_entries:
+            return
+        stale = [(r[0],) for r in db.execute("SELECT key FROM image_analysis ORDER BY last_used LIMIT ?", (count - self.max_entries,))]
+        removed = db.executemany("DELETE FROM image_analysis WHERE key = ?", stale).rowcount
+        # Derived rows store their base analysis key in `prompt`
+        removed += db.executemany("DELETE FROM image_analysis WHERE prompt = ?", stale).rowcount
+        db.executemany("DELETE FROM image_embedding WHERE key = ?", stale)
+        self.evictions += removed
+
+    def lookup_derived(self, base_key: Optional[str], kind: str) -> Optional[Dict[str, Any]]:
+        """Results computed from a cached analysis (e.g. the LLM-expanded description), keyed by (entry, kind)."""
+        if base_key is None:
+            return None
+        key = self.get_key(base_key, kind, "")
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT analysis FROM image_analysis WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.derived_misses += 1
+                return None
+            self.derived_hits += 1
+            # A hot derived result keeps its base analysis alive too (eviction removes both together)
+            now = time.time()
+            db.executemany("UPDATE image_analysis SET last_used = ? WHERE key = ?", [(now, key), (now, base_key)])
+            db.commit()
+        return json.loads(row[0])
+
+    def store_derived(self, base_key: Optional[str], kind: str, value: Dict[str, Any]):
+        if base_key is None:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO image_analysis (key, backend, prompt, dhash, analysis, created_at, last_used) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?)",
+                (self.get_key(base_key, kind, ""), kind, base_key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._evict(db)
+            db.commit()
+
+    def get_embedding(self, key: Optional[str], model: str) -> Optional[np.ndarray]:
+        if key is None:
+            return None
+        with self._lock:
+            row = self._db().execute("SELECT vector FROM image_embedding WHERE key = ? AND model = ?", (key, model)).fetchone()
+            if row is None:
+                return None
+            self.embedding_hits += 1
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def set_embedding(self, key: Optional[str], model: str, vector: np.ndarray):
+        if key is None:
+            return
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO image_embedding (key, model, vector) VALUES (?, ?, ?)",
+                (key, model, np.asarray(vector, dtype=np.float32).tobytes()),
+            )
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": IMAGE_CACHE_ENABLED,
+            "path": self.path,
+            "max_entries": self.max_entries,
+            "dhash_max_distance": self.dhash_max_distance,
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "embedding_hits": self.embedding_hits,
+            "derived_hits": self.derived_hits,
+            "derived_misses": self.derived_misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+image_cache = ImageAnalysisCache(IMAGE_CACHE_PATH, IMAGE_CACHE_MAX_ENTRIES, IMAGE_CACHE_DHASH_MAX_DISTANCE)
+
+async def get_or_generate_kg(texts: List[str], source_type: str = "text") -> Dict[str, Any]:
+    """Reuse a stored KG for an identical text set; otherwise run Mistral and remember the result."""
+    if not KG_CACHE_ENABLED:
+        return await generate_kg_from_texts(texts, source_type=source_type)
+    model = kg_model_id()
+    key = KGCache.get_key(texts, source_type, model)
+    try:
+        cached = await io_lane.run(kg_cache.get, key)
+    except Exception as e:
+        print(f"KG cache read failed: {e}")
+        cached = None
+    if cached is not None:
+        cached.setdefault("metadata", {})["cache"] = "hit"
+        return cached
+    kg = await generate_kg_from_texts(texts, source_type=source_type)
+    # Keyword fallbacks are cheap and usually mean the LLM was unavailable; don't pin them. Graphs built
+    # (even partly) on the llama.cpp fallback while Ollama's breaker was open don't belong under this key.
+    if kg.get("metadata", {}).get("models") == [model]:
+        try:
+            await io_lane.run(kg_cache.set, key, kg)
+        except Exception as e:
+            print(f"KG cache write failed: {e}")
+    return kg
+
 # --------------------- Request models ---------------------
 class EmbeddingRequest(BaseModel):
     texts: List[str]
@@ -550,6 +3070,8 @@ class RagQueryRequest(BaseModel):
     context_embeddings: List[List[float]]
     context_texts: List[str]
     top_k: Optional[int] = 5
+    stream: Optional[bool] = False
+    cache: Optional[bool] = True  # False skips the semantic answer cache (no lookup, no store)
 
 class MistralTestRequest(BaseModel):
     system_prompt: Optional[str] = "You are a helpful assistant."
@@ -561,6 +3083,22 @@ class RagByIdRequest(BaseModel):
     data_id: str
     query: str
     top_k: Optional[int] = 5
+    stream: Optional[bool] = False
+    exact: Optional[bool] = False  # force exhaustive search even above ANN_MIN_ROWS
+    nprobe: Optional[int] = None  # IVF lists to scan (recall vs latency), default ANN_NPROBE
+    cache: Optional[bool] = True  # False skips the semantic answer cache (no lookup, no store)
+
+RAG_MULTI_MAX_IDS = int(os.environ.get("RAG_MULTI_MAX_IDS", "32"))
+
+class RagMultiRequest(BaseModel):
+    data_ids: List[str]
+    query: str
+    top_k: Optional[int] = 5
+    per_corpus_k: Optional[int] = None  # candidates per data_id before the global merge (default top_k)
+    stream: Optional[bool] = False
+    exact: Optional[bool] = False
+    nprobe: Optional[int] = None
+    cache: Optional[bool] = True
 
 class MediaProcessResponse(BaseModel):
     image_or_pdf_analysis: Dict[str, Any]
@@ -582,6 +3120,7 @@ async def embed_and_query_advanced(request: Dict[str, Any]):
     pdf_content = request.get("pdf_content", "")
     top_k = request.get("top_k", 5)
     return_embeddings = request.get("return_embeddings", False)
+    stream = bool(request.get("stream", False))
     
     if not query_text:
         raise HTTPException(status_code=400, detail="Query text is required")
@@ -591,73 +3130,43 @@ async def embed_and_query_advanced(request: Dict[str, Any]):
     image_embeddings = []
     
     if image_files:
-        for i, img_b64 in enumerate(image_files):
-            try:
-                import base64
-                image_bytes = base64.b64decode(img_b64)
-                
-                # Get detailed image description using Pixtral or BLIP
-                if PIXTRAL_HTTP_URL:
-                    pix_out = call_pixtral_http(
-                        image_bytes=image_bytes, 
-                        pdf_text=None, 
-                        system_prompt=request.get("image_system_prompt", "You are an image analysis assistant."),
-                        user_prompt=request.get("image_user_prompt", "Provide a detailed description of this image.")
-                    )
-                    description = pix_out.get("analysis", "") or pix_out.get("caption", "")
-                else:
-                    blip_out = caption_with_blip(image_bytes)
-                    description = blip_out.get("caption", "")
-                
-                image_descriptions.append(description)
-                
-                # Generate embedding for the image description - use 16 cores
-                embedder = lazy_load_small_embedder()
-                set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
-                desc_embedding = embedder.encode([description])[0].tolist()
-                image_embeddings.append(desc_embedding)
-                
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Image processing failed: {e}")
+        # Size caps (413) and decoding happen once, before any model call
+        images = await prepare_images([decode_b64_image(img_b64) for img_b64 in image_files])
+        try:
+            # Describe all images at once using Pixtral or batched BLIP
+            outs = await describe_images(
+                images,
+                request.get("image_system_prompt", "You are an image analysis assistant."),
+                request.get("image_user_prompt", "Provide a detailed description of this image."),
+            )
+            image_descriptions = [out.get("analysis", "") or out.get("caption", "") for out in outs]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Image processing failed: {e}")
     
     # Combine all contexts (text + image descriptions)
     all_contexts = context_texts + image_descriptions
     
-    # Generate embeddings for all contexts - use 16 cores
+    # Generate embeddings for all contexts - use 16 cores; image captions reuse cached vectors
     if all_contexts:
-        embedder = lazy_load_small_embedder()
-        set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
-        context_embeddings = embedder.encode(all_contexts)
-        
-        # Create cache key from embeddings
-        cache_key = rag_cache.get_key(context_embeddings.tolist())
+        parts = []
+        if context_texts:
+            parts.append(await encode_batched(SMALL_EMBEDDING_MODEL, context_texts))
+        if image_descriptions:
+            parts.append(await embed_image_descriptions(images, image_descriptions))
+        context_embeddings = np.vstack(parts)
+        image_embeddings = context_embeddings[len(context_texts):].tolist()
         
-        # Check if we have cached RAG context
-        cached_context = None
-        if cache_key:
-            cached_context = rag_cache.get(cache_key)
-        
-        if not cached_context:
-            # Create new RAG context
-            cached_context = {
-                "embeddings": context_embeddings.tolist(),
-                "texts": all_contexts,
-                "created_at": time.time()
-            }
-            if cache_key:
-                rag_cache.set(cache_key, cached_context)
+        # Normalized context matrix, reused across requests with identical content
+        cached_context = await cpu_lane.run(rag_cache.get_or_build, context_embeddings, all_contexts)
         
         # Generate embedding for the query - use 16 cores
-        set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
-        query_embedding = embedder.encode([query_text])[0].tolist()
+        query_vec = await embed_query(SMALL_EMBEDDING_MODEL, query_text)
+        query_embedding = query_vec.tolist()
         
-        # Calculate similarities
-        similarities = cosine_similarity([query_embedding], cached_context["embeddings"])[0]
-        
-        # Get top-k most similar contexts
-        top_indices = similarities.argsort()[-top_k:][::-1]
+        # Calculate similarities and take the top-k
+        top_indices, top_scores = await cpu_lane.run(top_k_cosine, cached_context["matrix"], query_vec, top_k)
         top_contexts = [cached_context["texts"][i] for i in top_indices]
-        top_similarities = [float(similarities[i]) for i in top_indices]
+        top_similarities = [float(x) for x in top_scores]
         
         # Build prompt for Mistral with context - use 30 cores for Mistral
         context_str = "\n".join([f"Context {i+1}: {ctx}" for i, ctx in enumerate(top_contexts)])
@@ -676,19 +3185,13 @@ Query: {query_text}
 Please provide a detailed answer based on the context above.
 """
         
-        try:
-            set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
-            mistral_response = run_mistral(mistral_prompt)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Mistral call failed: {e}")
-        
         response = {
             "query_embedding": query_embedding,
             "similar_contexts": [
                 {"text": ctx, "similarity": float(sim)} 
                 for ctx, sim in zip(top_contexts, top_similarities)
             ],
-            "mistral_response": mistral_response,
+            "mistral_response": None,
             "top_k": top_k,
             "total_contexts": len(all_contexts),
             "image_contexts": len(image_descriptions),
@@ -699,24 +3202,40 @@ Please provide a detailed answer based on the context above.
         if return_embeddings:
             response["context_embeddings"] = context_embeddings.tolist()
             response["image_embeddings"] = image_embeddings
+        
+        if stream:
+            response.pop("mistral_response")
+            return sse_response(sse_answer_stream(response, mistral_prompt))
+        
+        try:
+            set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
+            response["mistral_response"] = await llm_lane.run(run_mistral, mistral_prompt)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Mistral call failed: {e}")
             
         return response
     else:
         # No contexts provided, just answer the query directly - use 30 cores for Mistral
         mistral_prompt = f"[SYSTEM]\nYou are a helpful assistant.\n\n[USER]\n{query_text}\n"
-        try:
-            set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
-            mistral_response = run_mistral(mistral_prompt)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Mistral call failed: {e}")
-        
-        return {
+        response = {
             "query_embedding": [],
             "similar_contexts": [],
-            "mistral_response": mistral_response,
+            "mistral_response": None,
             "top_k": top_k,
             "message": "No context provided, answering directly"
         }
+        
+        if stream:
+            response.pop("mistral_response")
+            return sse_response(sse_answer_stream(response, mistral_prompt))
+        
+        try:
+            set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
+            response["mistral_response"] = await llm_lane.run(run_mistral, mistral_prompt)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Mistral call failed: {e}")
+        
+        return response
 
 @app.post("/process_image_and_embed")
 async def process_image_and_embed(request: Dict[str, Any]):
@@ -730,27 +3249,15 @@ async def process_image_and_embed(request: Dict[str, Any]):
     if not image_b64:
         raise HTTPException(status_code=400, detail="Image is required")
     
+    image = (await prepare_images([decode_b64_image(image_b64)]))[0]
     try:
-        import base64
-        image_bytes = base64.b64decode(image_b64)
-        
         # Get detailed image description - use 30 cores for image processing
-        if PIXTRAL_HTTP_URL:
-            pix_out = call_pixtral_http(
-                image_bytes=image_bytes, 
-                pdf_text=None, 
-                system_prompt=system_prompt,
-                user_prompt=user_prompt
-            )
-            description = pix_out.get("analysis", "") or pix_out.get("caption", "")
-        else:
-            blip_out = caption_with_blip(image_bytes)
-            description = blip_out.get("caption", "")
+        out = await describe_image(image, system_prompt, user_prompt)
+        description = out.get("analysis", "") or out.get("caption", "")
         
-        # Generate embedding for the image description - use 16 cores
-        embedder = lazy_load_small_embedder()
-        set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
-        embedding = embedder.encode([description])[0].tolist()
+        # Embedding for the image description (cached with the analysis) - use 16 cores
+        embeddings = await embed_image_descriptions([image], [description])
+        embedding = embeddings[0].tolist()
         
         return {
             "description": description,
@@ -777,36 +3284,20 @@ async def rag_query(request: RagQueryRequest):
     if len(context_embeddings) != len(context_texts):
         raise HTTPException(status_code=400, detail="context_embeddings and context_texts must have the same length")
     
-    # Create cache key from embeddings
-    cache_key = rag_cache.get_key(context_embeddings)
-    
-    # Check if we have cached RAG context
-    cached_context = None
-    if cache_key:
-        cached_context = rag_cache.get(cache_key)
-    
-    if not cached_context:
-        # Create new RAG context
-        cached_context = {
-            "embeddings": context_embeddings,
-            "texts": context_texts,
-            "created_at": time.time()
-        }
-        if cache_key:
-            rag_cache.set(cache_key, cached_context)
+    # Normalized context matrix, reused across requests with identical content
+    try:
+        cached_context = await cpu_lane.run(rag_cache.get_or_build, context_embeddings, context_texts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid context_embeddings: {e}")
     
     # Generate embedding for the query - use 16 cores
-    embedder = lazy_load_small_embedder()
-    set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
-    query_embedding = embedder.encode([query])[0].tolist()
-    
-    # Calculate similarities
-    similarities = cosine_similarity([query_embedding], cached_context["embeddings"])[0]
+    query_vec = await embed_query(SMALL_EMBEDDING_MODEL, query)
+    query_embedding = query_vec.tolist()
     
-    # Get top-k most similar contexts
-    top_indices = similarities.argsort()[-top_k:][::-1]
+    # Calculate similarities and take the top-k
+    top_indices, top_scores = await cpu_lane.run(top_k_cosine, cached_context["matrix"], query_vec, top_k)
     top_contexts = [cached_context["texts"][i] for i in top_indices]
-    top_similarities = [float(similarities[i]) for i in top_indices]
+    top_similarities = [float(x) for x in top_scores]
     
     # Build prompt for Mistral with context - use 30 cores for Mistral
     context_str = "\n".join([f"Context {i+1}: {ctx}" for i, ctx in enumerate(top_contexts)])
@@ -825,151 +3316,630 @@ Query: {query}
 Please provide a detailed answer based on the context above.
 """
     
-    try:
-        set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
-        mistral_response = run_mistral(mistral_prompt)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Mistral call failed: {e}")
-    
-    return {
+    response = {
         "query_embedding": query_embedding,
         "similar_contexts": [
             {"text": ctx, "similarity": float(sim)} 
             for ctx, sim in zip(top_contexts, top_similarities)
         ],
-        "mistral_response": mistral_response,
+        "mistral_response": None,
         "top_k": top_k,
-        "total_contexts": len(context_texts)
+        "total_contexts": len(context_texts),
+        "cached": False,
     }
 
+    # Same context set (by content hash) and same retrieved rows: a close enough query reuses the answer
+    cache_key = None
+    if ANSWER_CACHE_ENABLED and request.cache and cached_context["key"]:
+        cache_key = answer_cache.make_key(
+            f"rag_query:{cached_context['key']}", top_indices.tolist(), SMALL_EMBEDDING_MODEL, kg_model_id()
+        )
+        hit = answer_cache.lookup(cache_key, query_vec)
+        if hit is not None:
+            response.update(mistral_response=hit[0], cached=True, cache_similarity=round(hit[1], 4))
+            if request.stream:
+                return sse_response(sse_cached_answer({k: v for k, v in response.items() if k != "mistral_response"}, hit[0]))
+            return response
+    store = answer_cache_writer(cache_key, query_vec)
+    
+    if request.stream:
+        response.pop("mistral_response")
+        return sse_response(sse_answer_stream(response, mistral_prompt, on_done=store))
+    
+    try:
+        set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
+        response["mistral_response"], served_model = await llm_lane.run(run_llm_recorded, run_mistral, mistral_prompt)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Mistral call failed: {e}")
+    if store:
+        store(response["mistral_response"], served_model)
+    
+    return response
+
 # --------------------- Modified Embedding Routes: store KG and embeddings, return data_id ---------------------
-def pack_embeddings_payload(texts: List[str], embeddings: List[List[float]], model_name: str) -> Dict[str, Any]:
+def pack_embeddings_payload(texts: List[str], embeddings: Any, model_name: str) -> Dict[str, Any]:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
     return {
         "model": model_name,
-        "dim": len(embeddings[0]) if embeddings else 0,
+        "dim": int(embeddings.shape[1]) if len(embeddings) else 0,
         "count": len(embeddings),
         "texts": texts,
         "embeddings": embeddings,
         "created_at": int(time.time() * 1000),
     }
 
-@app.post("/embed/small")
-async def embed_small(req: EmbeddingRequest):
-    if not req.texts:
-        raise HTTPException(status_code=400, detail="texts required")
-    set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
-    model = lazy_load_small_embedder()
-    try:
-        embs = model.encode(req.texts, batch_size=req.batch_size, convert_to_numpy=True, show_progress_bar=False)
-        embs_list = embs.tolist()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# Optional per-stage progress hook used by the job queue: await progress("stage_name")
+ProgressFn = Optional[Callable[[str], Awaitable[None]]]
+
+async def report_stage(progress: ProgressFn, stage: str):
+    if progress is not None:
+        await progress(stage)
 
+async def persist_corpus(texts: List[str], embs: np.ndarray, model_name: str, source_type: str,
+                         custom_kg_id: Optional[str], kg_prefix: str, progress: ProgressFn = None) -> Dict[str, Any]:
+    """Shared ingestion tail: Mistral KG, KG storage (O3/Mongo), embeddings (+ANN) on Lighthouse."""
     # Generate KG with Mistral
-    kg = generate_kg_from_texts(req.texts, source_type="text")
-    kg_id = gen_kg_id(req.kg_id)
+    await report_stage(progress, "kg")
+    kg = await get_or_generate_kg(texts, source_type=source_type)
+    kg_id = gen_kg_id(custom_kg_id)
 
-    # Store KG: O3 if available, otherwise MongoDB (_id will be the kg_id returned)
-    if has_o3_config():
-        loc = store_kg_to_o3(kg_json=kg, kg_id=kg_id, key_prefix=(req.kg_prefix or "kg/text/"))
-    else:
-        loc = store_kg_to_mongo(kg_json=kg, kg_id=req.kg_id)
+    payload = pack_embeddings_payload(texts, embs, model_name=model_name)
+    if len(embs) >= ANN_MIN_ROWS:
+        await report_stage(progress, "ann_index")
+        payload["ann_index"] = await cpu_lane.run(IVFIndex.build, embs)
 
-    # Store embeddings on Lighthouse
-    payload = pack_embeddings_payload(req.texts, embs_list, model_name="sentence-transformers/all-MiniLM-L6-v2")
-    cid = store_embeddings_to_lighthouse(payload)
+    # Store KG (O3 if available, otherwise MongoDB) and embeddings (Lighthouse) concurrently
+    await report_stage(progress, "store")
+    stored = await storage_fanout({
+        "kg": (STORAGE_KG_TIMEOUT_S, store_kg, (kg, kg_id, kg_prefix, custom_kg_id)),
+        "embeddings": (STORAGE_EMBEDDINGS_TIMEOUT_S, store_embeddings_to_lighthouse, (payload,)),
+    })
+    if not all(r["ok"] for r in stored.values()):
+        # Partial failure: tell the caller which backend failed and which write already landed
+        raise HTTPException(status_code=502, detail={"error": "Storage failed", "storage": storage_report(stored)})
+    loc, cid = stored["kg"]["value"], stored["embeddings"]["value"]
 
     data_id = build_data_id(cid, loc)
     return {"data_id": data_id, "kg_id": loc["kg_id"], "model": payload["model"], "count": payload["count"], "dim": payload["dim"]}
 
-@app.post("/embed/large")
-async def embed_large(req: EmbeddingRequest):
+async def ingest_texts(req: EmbeddingRequest, model_name: str, progress: ProgressFn = None) -> Dict[str, Any]:
     if not req.texts:
         raise HTTPException(status_code=400, detail="texts required")
-    set_torch_threads(EMBEDDING_THREADS)  # Use 16 cores for embeddings
-    model = lazy_load_large_embedder()
+    await report_stage(progress, "embed")
     try:
-        embs = model.encode(req.texts, batch_size=req.batch_size, convert_to_numpy=True, show_progress_bar=False)
-        embs_list = embs.tolist()
+        embs = await encode_batched(model_name, req.texts, batch_size=req.batch_size)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    kg = generate_kg_from_texts(req.texts, source_type="text")
-    kg_id = gen_kg_id(req.kg_id)
-
-    if has_o3_config():
-        loc = store_kg_to_o3(kg_json=kg, kg_id=kg_id, key_prefix=(req.kg_prefix or "kg/text/"))
-    else:
-        loc = store_kg_to_mongo(kg_json=kg, kg_id=req.kg_id)
+    return await persist_corpus(req.texts, embs, model_name, "text", req.kg_id, req.kg_prefix or "kg/text/", progress)
 
-    payload = pack_embeddings_payload(req.texts, embs_list, model_name="intfloat/e5-large-v2")
-    cid = store_embeddings_to_lighthouse(payload)
+@app.post("/embed/small")
+async def embed_small(req: EmbeddingRequest):
+    return await ingest_texts(req, SMALL_EMBEDDING_MODEL)
 
-    data_id = build_data_id(cid, loc)
-    return {"data_id": data_id, "kg_id": loc["kg_id"], "model": payload["model"], "count": payload["count"], "dim": payload["dim"]}
+@app.post("/embed/large")
+async def embed_large(req: EmbeddingRequest):
+    return await ingest_texts(req, LARGE_EMBEDDING_MODEL)
 
 # --------------------- Image → data_id (max detail, no embeddings returned) ---------------------
 @app.post("/image/to_data_id")
 async def image_to_data_id(request: Dict[str, Any]):
+    return await ingest_image(request)
+
+IMAGE_EXPAND_SYSTEM = (
+    "You transform a seed caption into an exhaustive, highly structured, long description.\n"
+    "Include: exact visible text, typography hints, colors, materials, counts, positions, layout, scene graph details, and notable fine details.\n"
+    "No JSON; produce a single long descriptive paragraph optimized for downstream KG extraction."
+)
+IMAGE_EXPAND_PROMPT_PREFIX = register_prompt_prefix("image_expand", f"[SYSTEM]\n{IMAGE_EXPAND_SYSTEM}\n\n[USER]\nSeed caption:\n")
+
+async def ingest_image(request: Dict[str, Any], progress: ProgressFn = None) -> Dict[str, Any]:
     image_b64 = request.get("image", "")
     kg_id_in = request.get("kg_id")
     kg_prefix = request.get("kg_prefix", "kg/image/")
     if not image_b64:
         raise HTTPException(status_code=400, detail="Image is required")
-    try:
-        import base64
-        image_bytes = base64.b64decode(image_b64)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {e}")
+    image = (await prepare_images([decode_b64_image(image_b64)]))[0]
 
     # Step 1: seed caption
+    await report_stage(progress, "caption")
     try:
-        if PIXTRAL_HTTP_URL:
-            pix_out = call_pixtral_http(
-                image_bytes=image_bytes,
-                pdf_text=None,
-                system_prompt="You are an expert image analysis assistant.",
-                user_prompt="Describe the image comprehensively including text (OCR), layout, colors, objects, actions, attributes, counts, and spatial relationships."
-            )
-            seed_desc = pix_out.get("analysis") or pix_out.get("caption") or ""
-        else:
-            seed_desc = caption_with_blip(image_bytes)["caption"]
+        out = await describe_image(
+            image,
+            "You are an expert image analysis assistant.",
+            "Describe the image comprehensively including text (OCR), layout, colors, objects, actions, attributes, counts, and spatial relationships."
+        )
+        seed_desc = out.get("analysis") or out.get("caption") or ""
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image analysis failed: {e}")
 
     # Step 2: expand to maximal detail
-    max_sys = (
-        "You transform a seed caption into an exhaustive, highly structured, long description.\n"
-        "Include: exact visible text, typography hints, colors, materials, counts, positions, layout, scene graph details, and notable fine details.\n"
-        "No JSON; produce a single long descriptive paragraph optimized for downstream KG extraction."
-    )
-    long_prompt = f"[SYSTEM]\n{max_sys}\n\n[USER]\nSeed caption:\n{seed_desc}\n\nReturn the most detailed single paragraph description possible."
-    set_torch_threads(MISTRAL_THREADS)
-    long_desc = run_mistral_max(long_prompt, max_tokens=1024)
+    await report_stage(progress, "expand")
+    long_prompt = f"{IMAGE_EXPAND_PROMPT_PREFIX}{seed_desc}\n\nReturn the most detailed single paragraph description possible."
+    # The expansion is as slow as the caption, so it is cached alongside the image's analysis
+    expand_model = kg_model_id()
+    expand_kind = f"expand:{expand_model}:{hashlib.sha256(IMAGE_EXPAND_SYSTEM.encode('utf-8')).hexdigest()[:16]}"
+    cached = await io_lane.run(image_cache.lookup_derived, image.analysis_key, expand_kind) if IMAGE_CACHE_ENABLED else None
+    if cached is not None:
+        long_desc = cached["text"]
+    else:
+        set_torch_threads(MISTRAL_THREADS)
+        long_desc, served_model = await llm_lane.run(
+            run_llm_recorded, run_mistral_max, long_prompt, max_tokens=1024, prefix="image_expand"
+        )
+        # llama-cli reports timeouts/failures as text; never keep those as the image's description
+        cacheable = long_desc and not long_desc.startswith("Error:") and served_model == expand_model
+        if IMAGE_CACHE_ENABLED and cacheable:
+            try:
+                await io_lane.run(image_cache.store_derived, image.analysis_key, expand_kind, {"text": long_desc})
+            except Exception as e:
+                print(f"Image cache write failed: {e}")
 
     # Step 3: embed only for storage
-    embedder = lazy_load_small_embedder()
-    set_torch_threads(EMBEDDING_THREADS)
-    emb = embedder.encode([long_desc])[0].tolist()
+    await report_stage(progress, "embed")
+    embs = await encode_batched(SMALL_EMBEDDING_MODEL, [long_desc])
 
-    # Step 4: KG
-    kg = generate_kg_from_texts([long_desc], source_type="image")
-    kg_id = gen_kg_id(kg_id_in)
+    # Steps 4-6: KG, store KG (O3 or Mongo), store embeddings on Lighthouse
+    result = await persist_corpus([long_desc], embs, SMALL_EMBEDDING_MODEL, "image", kg_id_in, kg_prefix, progress)
+    return {k: result[k] for k in ("data_id", "kg_id", "model", "dim")}
 
-    # Step 5: store KG (O3 or Mongo)
-    if has_o3_config():
-        loc = store_kg_to_o3(kg_json=kg, kg_id=kg_id, key_prefix=kg_prefix)
-    else:
-        loc = store_kg_to_mongo(kg_json=kg, kg_id=kg_id_in)
+# --------------------- PDF → data_id (streaming, page-parallel) ---------------------
+def _pdf_page_count(pdf_path: str) -> int:
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
 
-    # Step 6: store embeddings on Lighthouse
-    payload = pack_embeddings_payload([long_desc], [emb], model_name="sentence-transformers/all-MiniLM-L6-v2")
-    cid = store_embeddings_to_lighthouse(payload)
+def _extract_pdf_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Runs in the PDF process pool; returns the text of pages [start, end)."""
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        return [doc[i].get_text("text") for i in range(start, end)]
 
-    data_id = build_data_id(cid, loc)
-    return {"data_id": data_id, "kg_id": loc["kg_id"], "model": payload["model"], "dim": payload["dim"]}
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # By now lane, batcher, preload and llama monitor threads are running (and torch may be
+            # loaded); forking such a process can deadlock the children, so start fresh interpreters
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+class TokenChunker:
+    """
+    Incremental sliding-window chunker measured in embedding-model tokens.
+    feed() returns every complete `window`-token chunk available so far (consecutive chunks
+    share `overlap` tokens) and keeps the unfinished tail, so chunks may span page boundaries.
+    """
+
+    def __init__(self, tokenizer, window: int, overlap: int):
+        self.tokenizer = tokenizer
+        self.window = max(1, window)
+        self.stride = max(1, self.window - max(0, overlap))
+        self._buffer = ""
+        self._covered = 0  # leading buffer tokens already emitted in a previous chunk
+
+    def _spans(self, text: str) -> List[Tuple[int, int]]:
+        if self.tokenizer is not None:
+            try:
+                enc = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+                return [tuple(span) for span in enc["offset_mapping"]]
+            except Exception:
+                pass
+        return [(m.start(), m.end()) for m in re.finditer(r"\S+", text)]
+
+    def feed(self, text: str) -> List[str]:
+        if not text.strip():
+            return []
+        self._buffer = f"{self._buffer}\n{text}" if self._buffer else text
+        spans = self._spans(self._buffer)
+        chunks = []
+        start = 0
+        while start + self.window <= len(spans):
+            chunks.append(self._buffer[spans[start][0]:spans[start + self.window - 1][1]].strip())
+            start += self.stride
+        if chunks:
+            self._buffer = self._buffer[spans[start][0]:] if start < len(spans) else ""
+            self._covered = self.window - self.stride
+        return chunks
+
+    def flush(self) -> List[str]:
+        tail, self._buffer = self._buffer.strip(), ""
+        if not tail or len(self._spans(tail)) <= self._covered:
+            return []
+        return [tail]
+
+async def stream_pdf_chunks_to_embeddings(pdf_path: str, model_name: str) -> Tuple[List[str], np.ndarray, int]:
+    """
+    Extract pages in the process pool (at most PDF_MAX_INFLIGHT_TASKS ranges in flight),
+    chunk each page as soon as it arrives and hand the chunks to the encode batcher while
+    later pages are still being parsed. Returns (chunks, embeddings, page_count).
+    """
+    page_count = await cpu_lane.run(_pdf_page_count, pdf_path)
+    embedder = await cpu_lane.run(get_embedder, model_name)
+    tokenizer = getattr(embedder, "tokenizer", None)
+    window = min(CHUNK_TOKENS, max(8, int(getattr(embedder, "max_seq_length", CHUNK_TOKENS) or CHUNK_TOKENS) - 2))
+    chunker = TokenChunker(tokenizer, window, CHUNK_OVERLAP_TOKENS)
+
+    loop = asyncio.get_running_loop()
+    pool = get_pdf_pool()
+    ranges = [(s, min(s + PDF_PAGES_PER_TASK, page_count)) for s in range(0, page_count, PDF_PAGES_PER_TASK)]
+    extracting: List[asyncio.Future] = []
+    encoding: List[asyncio.Future] = []
+    chunks: List[str] = []
+    next_range = 0
+
+    def submit_chunks(new_chunks: List[str]):
+        if new_chunks:
+            chunks.extend(new_chunks)
+            encoding.append(asyncio.ensure_future(encode_batched(model_name, new_chunks)))
+
+    while next_range < len(ranges) or extracting:
+        while next_range < len(ranges) and len(extracting) < PDF_MAX_INFLIGHT_TASKS:
+            start, end = ranges[next_range]
+            extracting.append(loop.run_in_executor(pool, _extract_pdf_page_range, pdf_path, start, end))
+            next_range += 1
+        pages = await extracting.pop(0)  # page order is preserved
+        for page_text in pages:
+            submit_chunks(await cpu_lane.run(chunker.feed, page_text))
+    submit_chunks(chunker.flush())
+
+    if not encoding:
+        return [], np.empty((0, 0), dtype=np.float32), page_count
+    embeddings = np.concatenate(await asyncio.gather(*encoding), axis=0)
+    return chunks, embeddings, page_count
+
+def _spool_upload(src, suffix: str) -> str:
+    with tempfile.NamedTemporaryFile(mode="wb", delete=False, suffix=suffix) as f:
+        shutil.copyfileobj(src, f, length=1024 * 1024)
+        return f.name
+
+@app.post("/ingest/pdf")
+async def ingest_pdf(
+    file: UploadFile = File(...),
+    model: str = Form("small"),
+    kg_id: Optional[str] = Form(None),
+    kg_prefix: Optional[str] = Form(None),
+):
+    """PDF → chunks → embeddings + KG → data_id, without holding the whole document text in memory."""
+    model_name = LARGE_EMBEDDING_MODEL if model == "large" else SMALL_EMBEDDING_MODEL
+    pdf_path = await io_lane.run(_spool_upload, file.file, ".pdf")
+    try:
+        try:
+            chunks, embs, page_count = await stream_pdf_chunks_to_embeddings(pdf_path, model_name)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"PDF processing failed: {e}")
+        if not chunks:
+            raise HTTPException(status_code=400, detail="No extractable text in PDF")
+        result = await persist_corpus(chunks, embs, model_name, "pdf", kg_id, kg_prefix or "kg/pdf/")
+        return {**result, "pages": page_count}
+    finally:
+        try:
+            os.unlink(pdf_path)
+        except Exception:
+            pass
+
+# --------------------- Ingestion jobs (submit now, poll /jobs/{id}) ---------------------
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(OMNIMIND_STATE_DIR, "jobs.sqlite3"))
+JOB_RETENTION_S = float(os.environ.get("JOB_RETENTION_S", str(7 * 24 * 3600)))
+
+def _process_start_ticks(pid: int) -> Optional[str]:
+    """Kernel start time of `pid` (/proc/<pid>/stat field 22), so a reused pid is not mistaken for its predecessor."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+def current_job_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{_process_start_ticks(os.getpid()) or ''}"
+
+def job_owner_alive(owner: Optional[str]) -> bool:
+    """Whether the worker process that claimed a job is still running. Owners on other hosts count as alive."""
+    if not owner:
+        return False
+    host, pid, start = (owner.split(":") + ["", "", ""])[:3]
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return not start or _process_start_ticks(int(pid)) == start
+
+# kind -> coroutine(payload, progress) running the same pipeline as the synchronous route
+JOB_KINDS: Dict[str, Callable[[Dict[str, Any], ProgressFn], Awaitable[Dict[str, Any]]]] = {
+    "embed/small": lambda payload, progress: ingest_texts(EmbeddingRequest(**payload), SMALL_EMBEDDING_MODEL, progress),
+    "embed/large": lambda payload, progress: ingest_texts(EmbeddingRequest(**payload), LARGE_EMBEDDING_MODEL, progress),
+    "image/to_data_id": lambda payload, progress: ingest_image(payload, progress),
+}
+
+class JobStore:
+    """SQLite table of ingestion jobs; payloads are kept until the job finishes so restarts can resume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+                "stages TEXT NOT NULL, result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+            if "owner" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn = conn
+        return self._conn
+
+    def create(self, kind: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO jobs (id, kind, payload, status, stages, created_at, updated_at) VALUES (?, ?, ?, 'queued', '[]', ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now),
+            )
+            db.commit()
+        return job_id
+
+    def claim(self, job_id: str, owner: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Atomically move a queued job to running under `owner`; None if another worker has it (or it is gone)."""
+        with self._lock:
+            db = self._db()
+            cur = db.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, error = NULL, updated_at = ? WHERE id = ? AND status = 'queued'",
+                (owner, time.time(), job_id),
+            )
+            db.commit()
+            if cur.rowcount != 1:
+                return None
+            row = db.execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        for name in ("stages", "result"):
+            if name in fields and not isinstance(fields[name], str):
+                fields[name] = json.dumps(fields[name])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            db = self._db()
+            db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            db.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT id, kind, status, stages, result, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "stages": json.loads(row[3]),
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def recover(self, retention_s: float) -> List[str]:
+        """
+        Requeue jobs whose worker process died mid-run, drop old finished ones; returns queued ids in order.
+        Jobs still running in live sibling workers (sharing the database) are left alone.
+        """
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (time.time() - retention_s,))
+            running = db.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+            orphaned = [(job_id,) for job_id, owner in running if not job_owner_alive(owner)]
+            db.executemany("UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND status = 'running'", orphaned)
+            db.commit()
+            rows = db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+class JobQueue:
+    """In-process asyncio queue drained by `workers` tasks; the JobStore is the source of truth."""
+
+    def __init__(self, store: JobStore, workers: int):
+        self.store = store
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.owner: Optional[str] = None
+
+    async def start(self):
+        # Taken in the serving process (not at import), so pre-forked workers get distinct owners
+        self.owner = current_job_owner()
+        self._queue = asyncio.Queue()
+        for job_id in await io_lane.run(self.store.recover, JOB_RETENTION_S):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        job_id = await io_lane.run(self.store.create, kind, payload)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"Job {job_id} bookkeeping failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        # Queued ids can sit in several workers' queues (recovery); only the claiming worker runs the job
+        loaded = await io_lane.run(self.store.claim, job_id, self.owner)
+        if loaded is None:
+            return
+        kind, payload = loaded
+        stages: List[Dict[str, Any]] = []
+
+        async def progress(stage: str):
+            now = time.time()
+            if stages:
+                stages[-1].update(status="done", finished_at=now)
+            stages.append({"name": stage, "status": "running", "started_at": now})
+            await io_lane.run(self.store.update, job_id, stages=stages)
+
+        await io_lane.run(self.store.update, job_id, stages=stages)
+        try:
+            result = await JOB_KINDS[kind](payload, progress)
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            if stages:
+                stages[-1].update(status="failed", finished_at=time.time())
+            await io_lane.run(self.store.update, job_id, status="failed", stages=stages, error=str(detail), payload="{}")
+            return
+        if stages:
+            stages[-1].update(status="done", finished_at=time.time())
+        await io_lane.run(self.store.update, job_id, status="done", stages=stages, result=result, payload="{}")
+
+    async def stats(self) -> Dict[str, Any]:
+        # SQLite can block on a writer; keep it off the event loop and bounded so /health always answers
+        try:
+            by_status: Dict[str, Any] = await asyncio.wait_for(io_lane.run(self.store.counts), timeout=2.0)
+        except Exception as e:
+            by_status = {"error": str(e) or type(e).__name__}
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "queued_in_memory": self._queue.qsize() if self._queue is not None else 0,
+            "by_status": by_status,
+        }
+
+job_store = JobStore(JOB_DB_PATH)
+job_queue = JobQueue(job_store, JOB_WORKERS)
+
+class JobRequest(BaseModel):
+    kind: str
+    payload: Dict[str, Any]
+
+@app.post("/jobs", status_code=202)
+async def submit_job(req: JobRequest):
+    if req.kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind; expected one of {sorted(JOB_KINDS)}")
+    if req.kind.startswith("embed/"):
+        try:
+            texts = EmbeddingRequest(**req.payload).texts
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid payload: {e}")
+        if not texts:
+            raise HTTPException(status_code=400, detail="texts required")
+    elif not req.payload.get("image"):
+        raise HTTPException(status_code=400, detail="Image is required")
+    job_id = await job_queue.submit(req.kind, req.payload)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await io_lane.run(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 # --------------------- Smart RAG by data_id (auto-detect embedding model) ---------------------
+RAG_KG_EDGE_LIMIT = 256
+# Rows sampled per corpus to estimate its query-score distribution for /rag/multi calibration
+RAG_MULTI_CALIBRATION_SAMPLE = int(os.environ.get("RAG_MULTI_CALIBRATION_SAMPLE", "256"))
+
+def embedding_model_for_payload(stored_model: str, stored_dim: int) -> str:
+    if "large" in stored_model.lower() or stored_dim >= 1000:
+        return LARGE_EMBEDDING_MODEL
+    return SMALL_EMBEDDING_MODEL
+
+def kg_triples(kg: Any, limit: int = RAG_KG_EDGE_LIMIT) -> List[str]:
+    kg_edges = kg.get("edges", []) if isinstance(kg, dict) else []
+    triples = []
+    for e in kg_edges[:limit]:
+        src = e.get("source", "")
+        rel = e.get("relation", "")
+        tgt = e.get("target", "")
+        triples.append(f"{src} -{rel}-> {tgt}")
+    return triples
+
+RAG_PROMPT_PREFIX = register_prompt_prefix("rag", """
+[SYSTEM]
+You are a precise RAG assistant. Use provided contexts and KG triples. If uncertain, say so. Prefer verbatim facts from contexts.
+
+[CONTEXTS_AND_KG]
+""")
+
+def build_rag_by_id_prompt(full_context: str, query: str) -> str:
+    return RAG_PROMPT_PREFIX + f"""{full_context}
+
+[USER]
+Query: {query}
+
+[INSTRUCTIONS]
+Answer comprehensively with citations to 'Context i' where applicable and avoid speculation.
+"""
+
+def answer_cache_writer(cache_key: Optional[str], query_vec: Optional[np.ndarray]) -> Optional[Callable[[str, Optional[str]], None]]:
+    """on_done callback storing an answer under `cache_key` (built with kg_model_id()) if that backend served it."""
+    if cache_key is None:
+        return None
+    expected = kg_model_id()
+
+    def store(answer: str, served_model: Optional[str]):
+        if served_model == expected:
+            answer_cache.store(cache_key, query_vec, answer)
+    return store
+
+async def answer_rag(retrieval: Dict[str, Any], mistral_prompt: str, stream: bool,
+                     cache_key: Optional[str], query_vec: Optional[np.ndarray]):
+    """
+    Answer step shared by /rag/by_id and /rag/multi: serve from answer_cache when `cache_key`
+    has a close enough earlier query, otherwise generate (optionally streamed) and store.
+    """
+    retrieval["cached"] = False
+    if cache_key is not None:
+        hit = answer_cache.lookup(cache_key, query_vec)
+        if hit is not None:
+            retrieval.update(cached=True, cache_similarity=round(hit[1], 4))
+            if stream:
+                return sse_response(sse_cached_answer(retrieval, hit[0]))
+            return {"answer": hit[0], **retrieval}
+    store = answer_cache_writer(cache_key, query_vec)
+    if stream:
+        return sse_response(sse_answer_stream(retrieval, mistral_prompt, max_tokens=1024, prefix="rag", on_done=store))
+
+    set_torch_threads(MISTRAL_THREADS)
+    out, served_model = await llm_lane.run(run_llm_recorded, run_mistral_max, mistral_prompt, max_tokens=1024, prefix="rag")
+    if store:
+        store(out, served_model)
+    return {"answer": out, **retrieval}
+
 @app.post("/rag/by_id")
 async def rag_by_id(req: RagByIdRequest):
     try:
@@ -977,49 +3947,31 @@ async def rag_by_id(req: RagByIdRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid data_id: {e}")
 
-    # Fetch embeddings(+texts) from Lighthouse
+    # Fetch embeddings(+texts) from Lighthouse and the KG concurrently
+    fetched = await fetch_corpus_and_kg(cid, scheme, p1, p2)
+    if not fetched["embeddings"]["ok"]:
+        raise HTTPException(status_code=500, detail=f"Failed fetching embeddings: {fetched['embeddings']['error']}")
+    if not fetched["kg"]["ok"]:
+        raise HTTPException(status_code=500, detail=f"Failed fetching KG: {fetched['kg']['error']}")
+    emb_payload, kg = fetched["embeddings"]["value"], fetched["kg"]["value"]
     try:
-        emb_payload = fetch_json_from_lighthouse_cid(cid)
         texts = emb_payload.get("texts", [])
-        embeddings = emb_payload.get("embeddings", [])
+        embeddings = emb_payload["embeddings"]
         stored_model = emb_payload.get("model", "")
         stored_dim = emb_payload.get("dim", 0)
         
-        if not texts or not embeddings or len(texts) != len(embeddings):
+        if not texts or len(embeddings) == 0 or len(texts) != len(embeddings):
             raise RuntimeError("Invalid embedding payload from Lighthouse")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed fetching embeddings: {e}")
 
-    # Fetch KG
-    try:
-        if scheme == "o3":
-            bucket, key = p1, p2
-            s3 = get_o3_client()
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            kg = json.loads(obj["Body"].read())
-        elif scheme == "mongo":
-            collection, kg_id = p1, p2
-            kg = fetch_kg_from_mongo(collection, kg_id)
-        else:
-            raise RuntimeError("Unknown KG scheme")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed fetching KG: {e}")
-
     # 🧠 SMART MODEL SELECTION: Use the same model that was used for storage
-    set_torch_threads(EMBEDDING_THREADS)
-    
     # Auto-detect which embedding model to use based on stored model info
-    if "large" in stored_model.lower() or stored_dim >= 1000:
-        # Use large model for 1024D embeddings
-        embedder = lazy_load_large_embedder()
-        print(f"Using LARGE embedder for {stored_dim}D embeddings from {stored_model}")
-    else:
-        # Use small model for 384D embeddings  
-        embedder = lazy_load_small_embedder()
-        print(f"Using SMALL embedder for {stored_dim}D embeddings from {stored_model}")
+    query_model = embedding_model_for_payload(stored_model, stored_dim)
+    print(f"Using {query_model} for {stored_dim}D embeddings from {stored_model}")
     
     # Generate query embedding with matching model
-    q_emb = embedder.encode([req.query])[0].tolist()
+    q_emb = (await embed_query(query_model, req.query)).tolist()
     
     # Verify dimensions match
     query_dim = len(q_emb)
@@ -1030,44 +3982,148 @@ async def rag_by_id(req: RagByIdRequest):
         )
     
     # RAG retrieval
-    sims = cosine_similarity([q_emb], embeddings)[0]
-    top_indices = sims.argsort()[-req.top_k :][::-1]
+    top_indices, top_scores, search_info = await cpu_lane.run(
+        search_corpus, cid, emb_payload, np.asarray(q_emb, dtype=np.float32), req.top_k, req.exact, req.nprobe
+    )
     top_contexts = [texts[i] for i in top_indices]
-    top_scores = [float(sims[i]) for i in top_indices]
 
     # Add KG triples
-    kg_edges = kg.get("edges", []) if isinstance(kg, dict) else []
-    triples = []
-    for e in kg_edges[:256]:
-        src = e.get("source", "")
-        rel = e.get("relation", "")
-        tgt = e.get("target", "")
-        triples.append(f"{src} -{rel}-> {tgt}")
+    triples = kg_triples(kg)
     triples_block = "\n".join(triples)
     context_block = "\n".join([f"Context {i+1}: {c}" for i, c in enumerate(top_contexts)])
     full_context = context_block + ("\n\nKG Triples:\n" + triples_block if triples_block else "")
 
-    mistral_prompt = f"""
-[SYSTEM]
-You are a precise RAG assistant. Use provided contexts and KG triples. If uncertain, say so. Prefer verbatim facts from contexts.
+    mistral_prompt = build_rag_by_id_prompt(full_context, req.query)
+    retrieval = {
+        "similar_contexts": [{"index": int(i), "similarity": s} for i, s in zip(top_indices.tolist(), top_scores)],
+        "used_kg_edges": len(triples),
+        "model_info": f"Used {stored_model} ({stored_dim}D) for query embedding",
+        "search": search_info,
+    }
+    # data_id pins both the embeddings CID and the KG, so it fully determines the prompt's context
+    cache_key = None
+    if ANSWER_CACHE_ENABLED and req.cache:
+        cache_key = answer_cache.make_key(f"rag_by_id:{req.data_id}", top_indices.tolist(), query_model, kg_model_id())
+    return await answer_rag(retrieval, mistral_prompt, req.stream, cache_key, np.asarray(q_emb, dtype=np.float32))
 
-[CONTEXTS_AND_KG]
-{full_context}
+# --------------------- Federated RAG over several data_ids ---------------------
+def search_corpus_calibrated(cid: str, entry: Dict[str, Any], query: np.ndarray, top_k: int,
+                             exact: bool = False, nprobe: Optional[int] = None) -> Tuple[List[Tuple[int, float, float]], Dict[str, Any]]:
+    """
+    search_corpus plus a per-corpus z-score for each hit, so corpora embedded with different
+    models (whose raw cosine ranges differ) can be merged into one ranking. The score
+    distribution is estimated from a fixed sample of RAG_MULTI_CALIBRATION_SAMPLE rows.
+    """
+    ids, scores, info = search_corpus(cid, entry, query, top_k, exact, nprobe)
+    embeddings = entry["embeddings"]
+    n = len(embeddings)
+    sample = np.linspace(0, n - 1, num=min(n, RAG_MULTI_CALIBRATION_SAMPLE)).astype(np.int64)
+    q = normalize_rows(query)[0]
+    sample_scores = (np.asarray(embeddings[sample], dtype=np.float32) @ q) / entry["norms"][sample]
+    mean = float(sample_scores.mean())
+    std = float(sample_scores.std()) or 1.0
+    hits = [(int(i), s, (s - mean) / std) for i, s in zip(ids.tolist(), scores)]
+    info = dict(info, score_mean=round(mean, 4), score_std=round(std, 4))
+    return hits, info
 
-[USER]
-Query: {req.query}
+async def _fetch_corpus(data_id: str) -> Dict[str, Any]:
+    cid, scheme, p1, p2 = parse_data_id(data_id)
+    fetched = await fetch_corpus_and_kg(cid, scheme, p1, p2)
+    errors = [f"{name}: {r['error']}" for name, r in fetched.items() if not r["ok"]]
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return {"data_id": data_id, "cid": cid, "entry": fetched["embeddings"]["value"], "kg": fetched["kg"]["value"]}
 
-[INSTRUCTIONS]
-Answer comprehensively with citations to 'Context i' where applicable and avoid speculation.
-"""
-    set_torch_threads(MISTRAL_THREADS)
-    out = run_mistral_max(mistral_prompt, max_tokens=1024)
-    return {
-        "answer": out,
-        "similar_contexts": [{"index": int(i), "similarity": s} for i, s in zip(top_indices.tolist(), top_scores)],
-        "used_kg_edges": min(len(kg_edges), 256),
-        "model_info": f"Used {stored_model} ({stored_dim}D) for query embedding"
+@app.post("/rag/multi")
+async def rag_multi(req: RagMultiRequest):
+    """
+    RAG across several data_ids: fetch all corpora and KGs concurrently, embed the query
+    once per embedding model, merge a calibrated global top-k and make one LLM call.
+    """
+    data_ids = list(dict.fromkeys(req.data_ids))  # de-duplicate, keep order
+    if not data_ids:
+        raise HTTPException(status_code=400, detail="data_ids required")
+    if len(data_ids) > RAG_MULTI_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {RAG_MULTI_MAX_IDS} data_ids per request")
+    for data_id in data_ids:
+        try:
+            parse_data_id(data_id)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid data_id {data_id}: {e}")
+
+    fetched = await asyncio.gather(*[_fetch_corpus(d) for d in data_ids], return_exceptions=True)
+    corpora = []
+    failed = []
+    for data_id, result in zip(data_ids, fetched):
+        if isinstance(result, Exception):
+            failed.append({"data_id": data_id, "error": str(result)})
+        else:
+            corpora.append(result)
+    if not corpora:
+        raise HTTPException(status_code=502, detail={"message": "No corpus could be fetched", "failed": failed})
+
+    # Embed the query once per embedding model
+    for corpus in corpora:
+        entry = corpus["entry"]
+        corpus["model"] = embedding_model_for_payload(entry.get("model", ""), entry.get("dim", 0))
+    models = sorted({c["model"] for c in corpora})
+    query_vecs = dict(zip(models, await asyncio.gather(*[embed_query(m, req.query) for m in models])))
+
+    per_corpus_k = req.per_corpus_k or req.top_k
+    searchable = []
+    for corpus in corpora:
+        q = query_vecs[corpus["model"]]
+        if len(q) != corpus["entry"].get("dim", 0):
+            failed.append({"data_id": corpus["data_id"], "error": f"Dimension mismatch: query={len(q)}D, stored={corpus['entry'].get('dim', 0)}D"})
+            continue
+        searchable.append(corpus)
+    if not searchable:
+        raise HTTPException(status_code=400, detail={"message": "No corpus matches the query embedding dimension", "failed": failed})
+    searches = await asyncio.gather(*[
+        cpu_lane.run(search_corpus_calibrated, c["cid"], c["entry"], query_vecs[c["model"]], per_corpus_k, req.exact, req.nprobe)
+        for c in searchable
+    ])
+
+    merged = []
+    for corpus, (hits, info) in zip(searchable, searches):
+        corpus["search"] = info
+        for index, similarity, calibrated in hits:
+            merged.append((calibrated, similarity, index, corpus))
+    merged.sort(key=lambda h: h[0], reverse=True)
+    merged = merged[:req.top_k]
+
+    # KG triples from the corpora that contributed contexts, sharing one edge budget
+    contributing = list(dict.fromkeys(id(h[3]) for h in merged))
+    by_id = {id(c): c for c in searchable}
+    edge_budget = RAG_KG_EDGE_LIMIT // max(1, len(contributing))
+    triples = [t for cid_key in contributing for t in kg_triples(by_id[cid_key]["kg"], edge_budget)]
+
+    context_block = "\n".join([f"Context {i+1}: {h[3]['entry']['texts'][h[2]]}" for i, h in enumerate(merged)])
+    triples_block = "\n".join(triples)
+    full_context = context_block + ("\n\nKG Triples:\n" + triples_block if triples_block else "")
+    mistral_prompt = build_rag_by_id_prompt(full_context, req.query)
+
+    retrieval = {
+        "similar_contexts": [
+            {"data_id": h[3]["data_id"], "index": h[2], "similarity": h[1], "calibrated_score": round(h[0], 4)}
+            for h in merged
+        ],
+        "used_kg_edges": len(triples),
+        "corpora": [
+            {"data_id": c["data_id"], "model": c["model"], "count": len(c["entry"]["embeddings"]), "search": c["search"]}
+            for c in searchable
+        ],
+        "failed": failed,
     }
+    cache_key = None
+    if ANSWER_CACHE_ENABLED and req.cache:
+        # Contexts are identified across corpora as (data_id, row); the scope is the set of corpora searched.
+        # Query similarity is judged in the first model's space, which is enough to recognise rephrasings.
+        scope = "rag_multi:" + ",".join(sorted(c["data_id"] for c in searchable))
+        context_ids = [[h[3]["data_id"], h[2]] for h in merged]
+        cache_key = answer_cache.make_key(scope, context_ids, ",".join(models), kg_model_id())
+    query_vec = query_vecs[models[0]] if cache_key else None
+    return await answer_rag(retrieval, mistral_prompt, req.stream, cache_key, query_vec)
 
 # --------------------- Download Route ---------------------
 @app.get("/download/by_id/{data_id}")
@@ -1085,32 +4141,21 @@ async def download_by_id(data_id: str, format: str = "json"):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid data_id: {e}")
 
-    # Fetch embeddings from Lighthouse
-    try:
-        emb_payload = fetch_json_from_lighthouse_cid(cid)
-    except Exception as e:
-        if format == "kg":
-            emb_payload = {"error": "Could not fetch embeddings"}
-        else:
-            raise HTTPException(status_code=500, detail=f"Failed fetching embeddings: {e}")
+    # Fetch embeddings from Lighthouse and the KG concurrently
+    fetched = await fetch_corpus_and_kg(cid, scheme, p1, p2, fetch_embeddings=fetch_embeddings_json_by_cid)
+    if fetched["embeddings"]["ok"]:
+        emb_payload = fetched["embeddings"]["value"]
+    elif format == "kg":
+        emb_payload = {"error": "Could not fetch embeddings"}
+    else:
+        raise HTTPException(status_code=500, detail=f"Failed fetching embeddings: {fetched['embeddings']['error']}")
 
-    # Fetch KG
-    try:
-        if scheme == "o3":
-            bucket, key = p1, p2
-            s3 = get_o3_client()
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            kg = json.loads(obj["Body"].read())
-        elif scheme == "mongo":
-            collection, kg_id = p1, p2
-            kg = fetch_kg_from_mongo(collection, kg_id)
-        else:
-            raise RuntimeError("Unknown KG scheme")
-    except Exception as e:
-        if format == "embeddings":
-            kg = {"error": "Could not fetch knowledge graph"}
-        else:
-            raise HTTPException(status_code=500, detail=f"Failed fetching KG: {e}")
+    if fetched["kg"]["ok"]:
+        kg = fetched["kg"]["value"]
+    elif format == "embeddings":
+        kg = {"error": "Could not fetch knowledge graph"}
+    else:
+        raise HTTPException(status_code=500, detail=f"Failed fetching KG: {fetched['kg']['error']}")
 
     # Return based on format
     if format == "embeddings":
@@ -1131,7 +4176,7 @@ async def test_mistral(req: MistralTestRequest):
     set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
     prompt = f"[SYSTEM]\n{req.system_prompt}\n\n[USER]\n{req.user_prompt}\n"
     try:
-        out = run_mistral_llama_cpp(prompt, threads=MISTRAL_THREADS, max_tokens=req.max_tokens or 256)
+        out = await llm_lane.run(run_mistral_llama_cpp, prompt, threads=MISTRAL_THREADS, max_tokens=req.max_tokens or 256)
         return {"output": out}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1142,6 +4187,7 @@ async def process_media(
     url: Optional[str] = Form(None),
     system_prompt: Optional[str] = Form(None),
     user_prompt: Optional[str] = Form(None),
+    stream: bool = Form(False),
 ):
     set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for image processing
 
@@ -1153,7 +4199,7 @@ async def process_media(
     
     if url:
         try:
-            r = requests.get(url, timeout=30)
+            r = await io_lane.run(requests.get, url, timeout=30)
             r.raise_for_status()
             content_bytes = r.content
             filename = url.split("/")[-1]
@@ -1166,33 +4212,31 @@ async def process_media(
 
     is_pdf = False
     is_image = False
+    image = None
     if filename and filename.lower().endswith(".pdf"):
         is_pdf = True
     else:
         try:
-            Image.open(io.BytesIO(content_bytes))
+            Image.open(io.BytesIO(content_bytes))  # header sniff only
             is_image = True
         except Exception:
             pass
+    if is_image:
+        image = (await prepare_images([content_bytes]))[0]
 
     image_or_pdf_analysis = {}
 
     pdf_text = None
     if is_pdf:
         try:
-            pdf_text = extract_text_from_pdf_bytes(content_bytes)
+            pdf_text = await cpu_lane.run(extract_text_from_pdf_bytes, content_bytes)
             image_or_pdf_analysis["pdf_text_snippet"] = pdf_text[:4000]
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"PDF processing failed: {e}")
 
     if is_image:
         try:
-            if PIXTRAL_HTTP_URL:
-                pix_out = call_pixtral_http(content_bytes, None, system_prompt or "", user_prompt or "")
-                image_or_pdf_analysis.update(pix_out)
-            else:
-                blip_out = caption_with_blip(content_bytes)
-                image_or_pdf_analysis.update(blip_out)
+            image_or_pdf_analysis.update(await describe_image(image, system_prompt or "", user_prompt or ""))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Image processing failed: {e}")
 
@@ -1210,14 +4254,48 @@ async def process_media(
         f"[INSTRUCTIONS]\nUse the media analysis above and answer the user's request clearly."
     )
 
+    if stream:
+        return sse_response(sse_answer_stream({"image_or_pdf_analysis": image_or_pdf_analysis}, final_prompt))
+
     try:
         set_torch_threads(MISTRAL_THREADS)  # Use 30 cores for Mistral
-        mistral_out = run_mistral(final_prompt)
+        mistral_out = await llm_lane.run(run_mistral, final_prompt)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Mistral call failed: {e}")
 
     return MediaProcessResponse(image_or_pdf_analysis=image_or_pdf_analysis, final_answer=mistral_out)
 
+@app.on_event("startup")
+def start_llama_pool():
+    if LLAMA_POOL_ENABLED:
+        llama_pool.start()
+
+@app.on_event("shutdown")
+def stop_llama_pool():
+    llama_pool.shutdown()
+
+@app.on_event("shutdown")
+def close_storage_clients():
+    storage_clients.close()
+
+@app.on_event("startup")
+def start_model_preload():
+    # Background thread: the server accepts connections immediately, /ready flips once warm
+    threading.Thread(target=preload_models, args=(MODEL_PRELOAD,), name="model-preload", daemon=True).start()
+
+@app.get("/ready")
+async def ready():
+    report = readiness()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+
 @app.get("/health")
 async def health():
     return {
@@ -1230,6 +4308,23 @@ async def health():
         "mongo_db": MONGODB_DB if MONGODB_URI else None,
         "lighthouse_token_set": bool(LIGHTHOUSE_TOKEN),
         "lighthouse_sdk_only": True,
+        "llama_pool": llama_pool.stats(),
+        "executors": {lane.name: lane.stats() for lane in (cpu_lane, llm_lane, io_lane)},
+        "encode_batchers": {name: b.stats() for name, b in list(_encode_batchers.items())},
+        "caption_batcher": blip_batcher.stats(),
+        "embedding_backends": {m: embedding_backend(m) for m in (SMALL_EMBEDDING_MODEL, LARGE_EMBEDDING_MODEL)},
+        "jobs": await job_queue.stats(),
+        "storage_clients": storage_clients.stats(),
+        "http_backends": {b.name: b.stats() for b in (pixtral_breaker, ollama_breaker)},
+        "readiness": readiness(),
+        "caches": {
+            "rag_context": rag_cache.stats(),
+            "query_embeddings": query_embedding_cache.stats(),
+            "cid_payloads": cid_cache.stats(),
+            "knowledge_graphs": kg_cache.stats(),
+            "image_analysis": image_cache.stats(),
+            "answers": answer_cache.stats(),
+        },
     }
 
 if __name__ == "__main__":
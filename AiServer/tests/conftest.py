@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# server.py reads its configuration at import time; keep test state out of the working tree
+os.environ.setdefault("OMNIMIND_STATE_DIR", tempfile.mkdtemp(prefix="omnimind-tests-"))
+os.environ.setdefault("MODEL_PRELOAD", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
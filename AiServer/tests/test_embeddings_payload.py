@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+import pytest
+
+import server
+
+
+def make_payload(rows=64, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "texts": [f"text {i} – ünïcödé" for i in range(rows)],
+        "embeddings": rng.standard_normal((rows, dim), dtype=np.float32),
+        "model": server.SMALL_EMBEDDING_MODEL,
+        "dim": dim,
+    }
+
+
+def test_float32_round_trip_is_exact():
+    payload = make_payload()
+    decoded = server.decode_embeddings_payload(server.encode_embeddings_payload(payload, dtype="float32"))
+    assert decoded["texts"] == payload["texts"]
+    assert decoded["model"] == payload["model"]
+    assert (decoded["count"], decoded["dim"], decoded["dtype"]) == (64, 16, "float32")
+    assert decoded["embeddings"].dtype == np.float32
+    np.testing.assert_array_equal(decoded["embeddings"], payload["embeddings"])
+    assert "ann_index" not in decoded
+
+
+def test_float16_round_trip_within_half_precision():
+    payload = make_payload()
+    data = server.encode_embeddings_payload(payload, dtype="float16")
+    decoded = server.decode_embeddings_payload(data)
+    assert decoded["dtype"] == "float16"
+    assert decoded["embeddings"].dtype == np.float32
+    np.testing.assert_allclose(decoded["embeddings"], payload["embeddings"], rtol=1e-3, atol=1e-3)
+    assert len(data) < len(server.encode_embeddings_payload(payload, dtype="float32"))
+
+
+def test_matrix_is_16_byte_aligned():
+    data = server.encode_embeddings_payload(make_payload())
+    _, _, header_len = server._EMB_PAYLOAD_PREFIX.unpack_from(data, 0)
+    assert (server._EMB_PAYLOAD_PREFIX.size + header_len) % 16 == 0
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_round_trip_with_ann_section(dtype):
+    payload = make_payload(rows=500, dim=8)
+    index = server.IVFIndex.build(payload["embeddings"], nlist=10)
+    decoded = server.decode_embeddings_payload(
+        server.encode_embeddings_payload(dict(payload, ann_index=index, norms=server.row_norms(payload["embeddings"])), dtype=dtype)
+    )
+    assert "ann" not in decoded and "norms" not in decoded
+    restored = decoded["ann_index"]
+    np.testing.assert_array_equal(restored.centroids, index.centroids)
+    np.testing.assert_array_equal(restored.list_offsets, index.list_offsets)
+    np.testing.assert_array_equal(restored.list_ids, index.list_ids)
+    assert decoded["texts"] == payload["texts"]
+
+
+def test_legacy_json_payload_is_accepted():
+    payload = make_payload(rows=3, dim=4)
+    doc = dict(payload, embeddings=payload["embeddings"].tolist())
+    decoded = server.decode_embeddings_payload(json.dumps(doc).encode("utf-8"))
+    assert decoded["texts"] == payload["texts"]
+    np.testing.assert_allclose(np.asarray(decoded["embeddings"], dtype=np.float32), payload["embeddings"])
+
+
+def test_json_format_drops_ann_index_and_norms(monkeypatch):
+    monkeypatch.setattr(server, "EMBEDDINGS_PAYLOAD_FORMAT", "json")
+    payload = make_payload(rows=200, dim=8)
+    payload.update(ann_index=server.IVFIndex.build(payload["embeddings"], nlist=4), norms=server.row_norms(payload["embeddings"]))
+    data, suffix = server.serialize_embeddings_payload(payload)
+    assert suffix == ".json"
+    decoded = server.decode_embeddings_payload(data)
+    assert set(decoded) == {"texts", "embeddings", "model", "dim"}
+
+
+def test_binary_format_suffix(monkeypatch):
+    monkeypatch.setattr(server, "EMBEDDINGS_PAYLOAD_FORMAT", "binary")
+    data, suffix = server.serialize_embeddings_payload(make_payload())
+    assert suffix == ".omniemb"
+    assert data.startswith(server.EMB_PAYLOAD_MAGIC)
+
+
+def test_rejects_mismatched_texts_and_unknown_dtype():
+    payload = make_payload(rows=4)
+    with pytest.raises(ValueError):
+        server.encode_embeddings_payload(dict(payload, texts=payload["texts"][:3]))
+    with pytest.raises(ValueError):
+        server.encode_embeddings_payload(payload, dtype="int8")
+
+
+def test_rejects_unknown_version():
+    data = bytearray(server.encode_embeddings_payload(make_payload(rows=2)))
+    server._EMB_PAYLOAD_PREFIX.pack_into(data, 0, server.EMB_PAYLOAD_MAGIC, server.EMB_PAYLOAD_VERSION + 1, 0)
+    with pytest.raises(ValueError):
+        server.decode_embeddings_payload(bytes(data))
@@ -0,0 +1,43 @@
+import numpy as np
+
+import server
+
+
+def clustered(rows=2000, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, rows)
+    return centers[labels] + 0.1 * rng.standard_normal((rows, dim), dtype=np.float32)
+
+
+def test_lists_partition_all_rows():
+    matrix = clustered()
+    index = server.IVFIndex.build(matrix, nlist=16)
+    assert index.nlist == 16
+    assert index.list_offsets[0] == 0 and index.list_offsets[-1] == len(matrix)
+    assert sorted(index.list_ids.tolist()) == list(range(len(matrix)))
+
+
+def test_probing_every_list_matches_exact_search():
+    matrix = clustered()
+    norms = server.row_norms(matrix)
+    index = server.IVFIndex.build(matrix, nlist=16)
+    query = server.normalize_rows(matrix[7] + 0.05)[0]
+    ids, scores = index.search(matrix, norms, query, k=10, nprobe=index.nlist)
+    exact_ids, exact_scores = server.top_k_cosine(server.normalize_rows(matrix), query, 10)
+    assert ids.tolist() == exact_ids.tolist()
+    np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+
+
+def test_few_probes_keep_high_recall_on_clustered_data():
+    matrix = clustered()
+    norms = server.row_norms(matrix)
+    normalized = server.normalize_rows(matrix)
+    index = server.IVFIndex.build(matrix, nlist=16)
+    recall = []
+    for row in range(0, 200, 10):
+        query = normalized[row]
+        ids, _ = index.search(matrix, norms, query, k=10, nprobe=4)
+        exact_ids, _ = server.top_k_cosine(normalized, query, 10)
+        recall.append(len(set(ids.tolist()) & set(exact_ids.tolist())) / 10)
+    assert np.mean(recall) >= 0.9
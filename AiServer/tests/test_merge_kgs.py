@@ -0,0 +1,38 @@
+import server
+
+
+def test_nodes_merge_by_normalized_label():
+    kg = server.merge_kgs([
+        {"nodes": [{"id": "node1", "label": "Neural Network"}, {"id": "node2", "label": "GPU"}],
+         "edges": [{"source": "node1", "target": "node2", "relation": "runs on"}]},
+        {"nodes": [{"id": "node1", "label": "neural  network."}, {"id": "node2", "label": "Training"}],
+         "edges": [{"source": "node1", "target": "node2", "relation": "needs"}]},
+    ])
+    labels = {n["label"]: n for n in kg["nodes"]}
+    assert set(labels) == {"Neural Network", "GPU", "Training"}
+    assert labels["Neural Network"]["mentions"] == 2
+    assert labels["Neural Network"]["id"] == server.kg_node_id("neural network")
+    assert len(kg["edges"]) == 2
+
+
+def test_duplicate_edges_collapse_and_dangling_edges_drop():
+    window = {
+        "nodes": [{"id": "a", "label": "Alpha"}, {"id": "b", "label": "Beta"}],
+        "edges": [
+            {"source": "a", "target": "b", "relation": "Uses"},
+            {"source": "a", "target": "missing", "relation": "uses"},
+            "not an edge",
+        ],
+    }
+    kg = server.merge_kgs([window, window])
+    assert kg["edges"] == [{
+        "source": server.kg_node_id("alpha"),
+        "target": server.kg_node_id("beta"),
+        "relation": "uses",
+        "evidence": "",
+    }]
+
+
+def test_blank_labels_and_empty_windows_are_ignored():
+    kg = server.merge_kgs([{}, {"nodes": [{"id": "x", "label": "  "}, None]}])
+    assert kg == {"nodes": [], "edges": []}
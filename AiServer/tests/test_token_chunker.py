@@ -0,0 +1,30 @@
+import server
+
+
+def words(n, start=0):
+    return " ".join(f"w{i}" for i in range(start, start + n))
+
+
+def test_windows_overlap_by_configured_tokens():
+    chunker = server.TokenChunker(None, window=4, overlap=1)
+    chunks = chunker.feed(words(10)) + chunker.flush()
+    assert chunks == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+
+
+def test_chunks_span_feed_boundaries():
+    chunker = server.TokenChunker(None, window=4, overlap=0)
+    assert chunker.feed(words(3)) == []
+    assert chunker.feed(words(3, start=3)) == ["w0 w1 w2\nw3"]
+    assert chunker.flush() == ["w4 w5"]
+
+
+def test_flush_skips_tail_already_covered_by_overlap():
+    chunker = server.TokenChunker(None, window=4, overlap=2)
+    assert chunker.feed(words(4)) == ["w0 w1 w2 w3"]
+    assert chunker.flush() == []
+
+
+def test_blank_input_produces_nothing():
+    chunker = server.TokenChunker(None, window=4, overlap=1)
+    assert chunker.feed("   \n ") == []
+    assert chunker.flush() == []